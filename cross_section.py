@@ -0,0 +1,105 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import ConvexHull
+import mesh_io
+
+
+SECTION_MODES = ('hull', 'contour')
+
+
+# unique edges (E, 2) of a triangle mesh and the three edges of every face (F, 3)
+def build_edges(faces):
+  faces = np.asarray(faces)
+  e = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+  e.sort(axis=1)
+  edges, inverse = np.unique(e, axis=0, return_inverse=True)
+  face_edges = inverse.reshape(3, -1).T
+  return edges, face_edges
+
+
+_edges = None
+
+# edge adjacency of the SMPL faces, built once per process
+def get_edges():
+  global _edges
+  if _edges is None:
+    _edges = build_edges(mesh_io.get_faces())
+  return _edges
+
+
+# section of a mesh by the plane through origin with the given normal. Returns
+# the intersection points (K, 3), the segments joining them (S, 2) and the
+# contour each point belongs to (K,).
+def calc_section(vertex, origin, normal, edges=None):
+  if edges is None:
+    edges = get_edges()
+  edge, face_edge = edges
+  vertex = np.asarray(vertex, dtype=np.float64)
+  dist = (vertex - origin).dot(normal)
+  side = dist >= 0
+
+  crossing = side[edge[:, 0]] != side[edge[:, 1]]
+  # a face cut by the plane has exactly two crossing edges
+  cut = crossing[face_edge]
+  segment = face_edge[cut.sum(axis=1) == 2]
+  segment = segment[cut[cut.sum(axis=1) == 2]].reshape(-1, 2)
+
+  if len(segment) == 0:
+    return np.zeros((0, 3)), segment, np.zeros(0, dtype=np.intp)
+
+  node, segment = np.unique(segment, return_inverse=True)
+  segment = segment.reshape(-1, 2)
+  a, b = edge[node, 0], edge[node, 1]
+  t = (dist[a] / (dist[a] - dist[b]))[:, None]
+  points = vertex[a] + t * (vertex[b] - vertex[a])
+
+  graph = sp.coo_matrix((np.ones(len(segment)), (segment[:, 0], segment[:, 1])),
+                        shape=(len(node), len(node)))
+  _, label = connected_components(graph, directed=False)
+  return points, segment, label
+
+
+# perimeter of the contour of the section closest to center, either the length
+# of the contour itself or of its convex hull (what a tape measure follows)
+def calc_perimeter(vertex, origin, normal, center=None, mode='hull', edges=None):
+  if mode not in SECTION_MODES:
+    raise ValueError('Unknown section mode %s, expected one of %s'
+                     % (mode, ', '.join(SECTION_MODES)))
+  normal = np.asarray(normal, dtype=np.float64)
+  normal = normal / np.linalg.norm(normal)
+  if center is None:
+    center = origin
+  points, segment, label = calc_section(vertex, origin, normal, edges)
+  if len(points) == 0:
+    return 0.0
+
+  num_label = label.max() + 1
+  count = np.bincount(label, minlength=num_label)
+  centroid = np.stack([np.bincount(label, points[:, i], num_label)
+                       for i in range(3)], axis=1) / count[:, None]
+  keep = np.argmin(np.sum((centroid - center)**2.0, axis=1))
+
+  if mode == 'contour':
+    segment = segment[label[segment[:, 0]] == keep]
+    return np.sum(np.sqrt(np.sum(
+        (points[segment[:, 0]] - points[segment[:, 1]])**2.0, axis=1)))
+
+  points = points[label == keep]
+  if len(points) < 3:
+    return 0.0
+  # 2D coordinates in the plane
+  u = np.cross(normal, [1.0, 0.0, 0.0])
+  if np.linalg.norm(u) < 1e-6:
+    u = np.cross(normal, [0.0, 1.0, 0.0])
+  u /= np.linalg.norm(u)
+  v = np.cross(normal, u)
+  # for 2D hulls qhull reports the perimeter as area
+  return ConvexHull(np.stack((points.dot(u), points.dot(v)), axis=1)).area
+
+
+# plane best fitting a closed loop of points: its centroid and normal
+def fit_plane(points):
+  center = points.mean(axis=0)
+  _, _, vt = np.linalg.svd(points - center)
+  return center, vt[2]
@@ -19,19 +19,22 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 import extract_measurements
+import shape_measurements
+import mesh_io
+import utils
 import sys
 import cv2
 from absl import flags
 import numpy as np
 
 import skimage.io as io
-import tensorflow as tf
 
 from src.util import renderer as vis_util
 from src.util import image as img_util
 from src.util import openpose as op_util
 import src.config
 from src.RunModel import RunModel
+from src.util.session import make_session
 
 flags.DEFINE_string('img_path', 'data/k3.png', 'Image to run')
 flags.DEFINE_string(
@@ -118,10 +121,19 @@ def preprocess_image(img_path, json_path=None):
     return crop, proc_param, img
 
 
-def main(img_path, height, json_path=None):
+def main(img_path, height, json_path=None, mesh_format=None, mesh_path=None,
+         shape_only=False, model=None, return_weight=False):
+    """
+    Measures the person in img_path. Pass an already loaded RunModel as
+    model to skip building the graph and restoring the checkpoint, see
+    pipeline.MeasurementPipeline. With return_weight, returns the
+    measurements and the estimated weight (kg). With shape_only, a mesh
+    written for mesh_format is the T-posed shaped mesh that was measured.
+    """
 #    renderer = vis_util.SMPLRenderer(face_path='src/tf_smpl/smpl_faces.npy')
-    sess = tf.Session()
-    model = RunModel(sess=sess)
+    if model is None:
+        sess = make_session()
+        model = RunModel(sess=sess)
 #    cv2.imshow('input image for measurement extraction',img_path)
 #    cv2.waitKey(0)
 
@@ -145,7 +157,35 @@ def main(img_path, height, json_path=None):
 #    obj_mesh_name = 'test.obj'
 
     
-    extract_measurements.extract_measurements(height,verts[0])
+    if shape_only:
+        # Measure the T-posed mesh of the predicted betas instead of the
+        # posed vertices, straight from the shape basis.
+        betas = shape_measurements.theta_to_betas(theta)
+        if return_weight:
+            measure, weight = shape_measurements.measure_betas(
+                [height], betas, return_weight=True)
+        else:
+            measure = shape_measurements.measure_betas([height], betas)
+        measure = measure[0]
+        for name, value in zip(utils.M_STR, measure):
+            print("%s: %f" % (name, value))
+        if return_weight:
+            print("weight: %f" % weight[0])
+        if mesh_format is not None:
+            # The mesh that was measured, i.e. the T-posed shaped one.
+            if mesh_path is None:
+                mesh_path = 'test.%s' % mesh_format
+            mesh_io.save_mesh(mesh_path,
+                              shape_measurements.shaped_vertices(betas)[0],
+                              mesh_format=mesh_format)
+            print("Model Saved...")
+        if return_weight:
+            return measure.reshape(utils.M_NUM, 1), weight[0]
+        return measure.reshape(utils.M_NUM, 1)
+
+    return extract_measurements.extract_measurements(
+        height, verts[0], mesh_format=mesh_format, mesh_path=mesh_path,
+        return_weight=return_weight)
 
     
     
@@ -1,11 +1,17 @@
 
 
 import numpy as np
+import scipy.sparse as sp
+import collections
+import hashlib
 import sys
 import os
 import utils
+import mesh_io
+import cross_section
 
 DATA_DIR = "data"
+CP_PATH = os.path.join(DATA_DIR, 'customBodyPoints.txt')
 # loading data: file_list, vertex, mean, std
 #def obj2npy(label="male"):
 #    
@@ -43,96 +49,289 @@ DATA_DIR = "data"
         
  
 # read control  points(CP) from text file
-def convert_cp():
-    
-  f = open(os.path.join(DATA_DIR, 'customBodyPoints.txt'), "r")
-
+def convert_cp(cp_path=CP_PATH):
   tmplist = []
   cp = []
-  for line in f:
-    if '#' in line:
-      if len(tmplist) != 0:
-        cp.append(tmplist)
-        tmplist = []
-    elif len(line.split()) == 1:
-      continue
-    else:
-      tmplist.append(list(map(float, line.strip().split())))
+  with open(cp_path, "r") as f:
+    for line in f:
+      if '#' in line:
+        if len(tmplist) != 0:
+          cp.append(tmplist)
+          tmplist = []
+      elif len(line.split()) == 1:
+        continue
+      else:
+        tmplist.append(list(map(float, line.strip().split())))
   cp.append(tmplist)
 
-
+  validate_cp(cp)
   return cp
 
 
-# calculate measure data from given vertex by control points
-def calc_measure(cp, vertex,height):#, facet):
-  measure_list = []
-  
-  for measure in cp:
-#    print("#########################",measure)  
-#    print("@@@@@@@@@@@@")
+# check that every control point is well formed before it is compiled
+def validate_cp(cp, num_vertex=utils.V_NUM):
+  if len(cp) != utils.M_NUM:
+    raise ValueError('Expected %d measurements in control points, got %d'
+                     % (utils.M_NUM, len(cp)))
+  for m, measure in enumerate(cp):
+    validate_points(measure, utils.M_STR[m], num_vertex)
 
-    length = 0.0
-    p2 = vertex[int(measure[0][1]), :]
 
-    for i in range(0, len(measure)):#1
-      p1 = p2
-      if measure[i][0] == 1:
-        p2 = vertex[int(measure[i][1]), :]  
-        
-      elif measure[i][0] == 2:
-        p2 = vertex[int(measure[i][1]), :] * measure[i][3] + \
-        vertex[int(measure[i][2]), :] * measure[i][4]
-#        print("if 2 Measurement",int(measure[i][1]))
-        
+# check the control points of a single measurement
+def validate_points(measure, name, num_vertex=utils.V_NUM):
+  if len(measure) == 0:
+    raise ValueError('Measurement %s has no control points' % name)
+  for point in measure:
+    kind = int(point[0])
+    if kind not in (1, 2, 3) or len(point) < [2, 5, 7][kind - 1]:
+      raise ValueError('Malformed control point %s in measurement %s'
+                       % (point, name))
+    for i in point[1:kind + 1]:
+      if not 0 <= int(i) < num_vertex:
+        raise ValueError('Vertex index %d out of range in measurement %s'
+                         % (int(i), name))
+
+
+MeasurePlan = collections.namedtuple('MeasurePlan',
+                                     ['interp', 'starts', 'mask', 'closed'])
+
+# 'path' sums the control point segments, the others measure closed loops on
+# the section of the mesh by the plane fitted to the loop (see cross_section)
+METHODS = ('path',) + cross_section.SECTION_MODES
+
+# hand tuned factors for path measurements, not used for planar sections
+CORRECTIONS = ((8, 0.36), #reducing the error in measurement added due to unarranged vertices
+               (3, 0.6927))
+
+
+# compile control points into a sparse (num_path_points x V_NUM) interpolation
+# matrix, the first path point of every measurement and a mask that drops the
+# segment joining the last point of a measurement to the next measurement.
+# Paths ending on their first point are closed loops (circumferences).
+def compile_cp(cp, num_vertex=utils.V_NUM):
+  rows, cols, vals = [], [], []
+  starts = []
+  closed = []
+  row = 0
+  for measure in cp:
+    starts.append(row)
+    closed.append(len(measure) > 2 and measure[0] == measure[-1])
+    for point in measure:
+      if point[0] == 1:
+        idx, weight = point[1:2], [1.0]
+      elif point[0] == 2:
+        idx, weight = point[1:3], point[3:5]
       else:
-        p2 = vertex[int(measure[i][1]), :] * measure[i][4] + \
-          vertex[int(measure[i][2]), :] * measure[i][5] + \
-          vertex[int(measure[i][3]), :] * measure[i][6]
-      length += np.sqrt(np.sum((p1 - p2)**2.0))
+        idx, weight = point[1:4], point[4:7]
+      for i, w in zip(idx, weight):
+        rows.append(row)
+        cols.append(int(i))
+        vals.append(w)
+      row += 1
+
+  interp = sp.csr_matrix((vals, (rows, cols)), shape=(row, num_vertex))
+  starts = np.array(starts, dtype=np.intp)
+  mask = np.ones(row)
+  mask[np.append(starts[1:], row) - 1] = 0.0
+  return MeasurePlan(interp, starts, mask, np.array(closed))
+
+
+# load the compiled control points, preferring the .npz sidecar written next
+# to the text file. The sidecar is keyed on the sha1 of the text file and is
+# rebuilt whenever the text changes.
+def load_plan(cp_path=CP_PATH):
+  with open(cp_path, 'rb') as f:
+    key = hashlib.sha1(f.read()).hexdigest()
+  cache_path = os.path.splitext(cp_path)[0] + '.npz'
+
+  if os.path.exists(cache_path):
+    try:
+      with np.load(cache_path) as cache:
+        if str(cache['key']) == key:
+          interp = sp.csr_matrix(
+              (cache['data'], cache['indices'], cache['indptr']),
+              shape=tuple(cache['shape']))
+          return MeasurePlan(interp, cache['starts'], cache['mask'],
+                             cache['closed'])
+    except (KeyError, ValueError, OSError) as e:
+      print('Ignoring unreadable control point cache %s: %s' % (cache_path, e))
+
+  plan = compile_cp(convert_cp(cp_path))
+  tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+  try:
+    with open(tmp_path, 'wb') as f:
+      np.savez(f, key=key, data=plan.interp.data, indices=plan.interp.indices,
+               indptr=plan.interp.indptr, shape=plan.interp.shape,
+               starts=plan.starts, mask=plan.mask, closed=plan.closed)
+    os.replace(tmp_path, cache_path)
+  except OSError as e:
+    # read-only data dir: keep going with the freshly compiled plan
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    print('Could not write control point cache %s: %s' % (cache_path, e))
+  return plan
+
+
+_plan = None
+
+# control points loaded once per process
+def get_plan():
+  global _plan
+  if _plan is None:
+    _plan = load_plan()
+  return _plan
+
+
+# (..., num_path_points, 3) control points of one (V, 3) or many (..., V, 3) meshes
+def calc_path_points(plan, vertex):
+  vertex = np.asarray(vertex, dtype=np.float64)
+  batch_shape = vertex.shape[:-2]
+  num_vertex = vertex.shape[-2]
+  # V x (N * 3) so that every mesh goes through a single sparse matmul
+  v = np.moveaxis(vertex.reshape(-1, num_vertex, 3), 0, 1).reshape(num_vertex, -1)
+  points = plan.interp.dot(v).reshape(plan.interp.shape[0], -1, 3)
+  return np.moveaxis(points, 1, 0).reshape(batch_shape + points[:, 0].shape)
 
-    measure_list.append(length * 100)# * 1000
-  
-  measure_list = float(height)*(measure_list/measure_list[0])
-#  print("measure list = ",float(height)*(measure_list/measure_list[0])) 
-  measure_list[8] = measure_list[8] * 0.36#reducing the error in measurement added due to unarranged vertices
-  measure_list[3] = measure_list[3] * 0.6927
-#  print("measure list = ",float(height)*(measure_list/measure_list[0]))
-#  measure_list = float(height)*(measure_list/measure_list[0])
-  return np.array(measure_list).reshape(utils.M_NUM, 1)
+
+# length of every path from its (..., num_path_points, 3) control points
+def calc_segment_length(plan, points):
+  seg = np.sqrt(np.sum(np.diff(points, axis=-2)**2.0, axis=-1))
+  seg = np.append(seg, np.zeros(seg.shape[:-1] + (1,)), axis=-1) * plan.mask
+  return np.add.reduceat(seg, plan.starts, axis=-1)
+
+
+# length of every control point path on one (V, 3) or many (..., V, 3) meshes
+def calc_path_length(plan, vertex):
+  return calc_segment_length(plan, calc_path_points(plan, vertex))
+
+
+# perimeter of the planar section of one (V, 3) mesh through every closed
+# control point loop, mode is one of cross_section.SECTION_MODES
+def calc_section_length(plan, vertex, mode='hull'):
+  vertex = np.asarray(vertex, dtype=np.float64)
+  points = plan.interp.dot(vertex)
+  ends = np.append(plan.starts[1:], len(points))
+  length = []
+  for i in np.flatnonzero(plan.closed):
+    center, normal = cross_section.fit_plane(points[plan.starts[i]:ends[i]])
+    length.append(cross_section.calc_perimeter(vertex, center, normal,
+                                               mode=mode))
+  return np.array(length)
+
+
+# (..., M_NUM) lengths of one (V, 3) or many (..., V, 3) meshes by method
+def calc_length(plan, vertex, method='path'):
+  if method not in METHODS:
+    raise ValueError('Unknown measurement method %s, expected one of %s'
+                     % (method, ', '.join(METHODS)))
+  length = calc_path_length(plan, vertex)
+  if method != 'path':
+    vertex = np.asarray(vertex)
+    flat = length.reshape(-1, length.shape[-1])
+    for n, v in enumerate(vertex.reshape((-1,) + vertex.shape[-2:])):
+      flat[n, plan.closed] = calc_section_length(plan, v, method)
+  return length
+
+
+# scale (..., M_NUM) lengths to the given (...) heights, the corrections are
+# only applied to path measurements
+def scale_measure(length, height, plan=None, method='path'):
+  measure_list = length * 100
+  height = np.asarray(height, dtype=np.float64)[..., None]
+  measure_list = height*(measure_list/measure_list[..., :1])
+  for i, factor in CORRECTIONS:
+    if method == 'path' or not plan.closed[i]:
+      measure_list[..., i] = measure_list[..., i] * factor
+  return measure_list
+
+
+# calculate measure data from given vertex by control points
+def calc_measure(plan, vertex, height, method='path'):
+  measure_list = scale_measure(calc_length(plan, vertex, method), float(height),
+                               plan, method)
+  return measure_list.reshape(utils.M_NUM, 1)
+
+
+# meshes whose volume is computed at once by calc_weight, every one of them
+# needs a few (F_NUM,) float64 temporaries
+WEIGHT_CHUNK_SIZE = 64
+
+
+# body weight (kg) of one (V, 3) or many (..., V, 3) meshes from their volume,
+# the mesh is scaled like the measurements so that its height matches height
+def calc_weight(plan, vertex, height, chunk_size=WEIGHT_CHUNK_SIZE):
+  vertex = np.asarray(vertex)
+  faces = mesh_io.get_faces()
+  flat = vertex.reshape((-1,) + vertex.shape[-2:])
+  volume = np.empty(flat.shape[0])
+  for start in range(0, flat.shape[0], chunk_size):
+    volume[start:start + chunk_size] = utils.calc_volume(
+        flat[start:start + chunk_size], faces)
+  volume = volume.reshape(vertex.shape[:-2])
+  mesh_height = calc_path_length(plan, vertex)[..., 0] * 100
+  scale = np.asarray(height, dtype=np.float64) / mesh_height
+  return utils.BODY_DENSITY * np.abs(volume) * scale**3
+
+
+# calculate measure data of N meshes at once: vertices is (N, V, 3), heights is
+# (N,), returns (N, M_NUM) float32 and, with return_weight, the (N,) float32
+# weights. Meshes are processed chunk_size at a time to bound the size of the
+# float64 vertex buffers (about 0.33 MB per mesh), the weights in chunks of
+# WEIGHT_CHUNK_SIZE. method is one of METHODS.
+def extract_measurements_batch(heights, vertices, chunk_size=256,
+                               return_weight=False, method='path'):
+  vertices = np.asarray(vertices)
+  heights = np.asarray(heights, dtype=np.float64).reshape(-1)
+  if vertices.ndim != 3 or vertices.shape[0] != heights.shape[0]:
+    raise ValueError('Expected (N, V, 3) vertices and (N,) heights, got %s and %s'
+                     % (vertices.shape, heights.shape))
+
+  plan = get_plan()
+  measure = np.empty((vertices.shape[0], utils.M_NUM), dtype=np.float32)
+  weight = np.empty(vertices.shape[0], dtype=np.float32)
+  for start in range(0, vertices.shape[0], chunk_size):
+    end = start + chunk_size
+    length = calc_length(plan, vertices[start:end], method)
+    measure[start:end] = scale_measure(length, heights[start:end], plan, method)
+    if return_weight:
+      weight[start:end] = calc_weight(plan, vertices[start:end], heights[start:end])
+
+  if return_weight:
+    return measure, weight
+  return measure
 
 
 ##added code: extract body measurements given a .obj model in data.
-def extract_measurements(height, vertices):
-  genders = ["male"]#, "male"]
-  measure = []
-  for gender in genders:
-    # generate and load control point from txt to npy file
-    cp = convert_cp()
-
-#    vertex = obj2npy(gender)[0]
-    #calculte + convert
-    measure = calc_measure(cp, vertices, height)
-
-
-    #give body measurements one by one
-    for i in range(0, utils.M_NUM):
-      print("%s: %f" % (utils.M_STR[i], measure[i]))
-    
-    
-    
-    face_path = './src/tf_smpl/smpl_faces.npy'
-    faces = np.load(face_path)
-    obj_mesh_name = 'test.obj'
-    with open(obj_mesh_name, 'w') as fp:
-        for v in vertices:
-            fp.write( 'v %f %f %f\n' % ( v[0], v[1], v[2]) )
-        for f in faces: # Faces are 1-based, not 0-based in obj files
-            fp.write( 'f %d %d %d\n' %  (f[0] + 1, f[1] + 1, f[2] + 1) )
+# The mesh is only written when mesh_format is one of mesh_io.MESH_FORMATS
+# ('obj', 'ply', 'glb', 'npz'); mesh_path defaults to test.<mesh_format>.
+# With return_weight the estimated weight (kg) is returned as well. method is
+# one of METHODS.
+def extract_measurements(height, vertices, mesh_format=None, mesh_path=None,
+                         return_weight=False, method='path'):
+  # control points compiled into a sparse measurement plan
+  plan = get_plan()
 
-        
+  #calculte + convert
+  measure = calc_measure(plan, vertices, height, method)
+
+  #give body measurements one by one
+  for i in range(0, utils.M_NUM):
+    print("%s: %f" % (utils.M_STR[i], measure[i, 0]))
+
+  if return_weight:
+    weight = calc_weight(plan, vertices, height)
+    print("weight: %f" % weight)
+
+  if mesh_format is not None:
+    if mesh_path is None:
+      mesh_path = 'test.%s' % mesh_format
+    mesh_io.save_mesh(mesh_path, vertices, mesh_format=mesh_format)
     print("Model Saved...")
 
+  if return_weight:
+    return measure, weight
+  return measure
+
 
 #if __name__ == "__main__":
 #  extract_measurements()
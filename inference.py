@@ -13,6 +13,7 @@ import numpy as np
 from PIL import Image
 import cv2, pdb, glob, argparse
 from demo import main
+from src.util.session import make_session
 import tensorflow as tf
 
 
@@ -45,7 +46,7 @@ class DeepLabModel(object):
 		with self.graph.as_default():
 			tf.import_graph_def(graph_def, name='')
 
-		self.sess = tf.Session(graph=self.graph)
+		self.sess = make_session(graph=self.graph)
 
 	def run(self, image):
 		"""Runs inference on a single image.
@@ -110,15 +111,6 @@ def label_to_color_image(label):
 
 
 
-parser = argparse.ArgumentParser(description='Deeplab Segmentation')
-parser.add_argument('-i', '--input_dir', type=str, required=True,help='Directory to save the output results. (required)')
-parser.add_argument('-ht', '--height', type=int, required=True,help='Directory to save the output results. (required)')
-
-args=parser.parse_args()
-
-dir_name=args.input_dir;
-
-
 ## setup ####################
 
 LABEL_NAMES = np.asarray([
@@ -126,6 +118,7 @@ LABEL_NAMES = np.asarray([
 	'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse', 'motorbike',
 	'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tv'
 ])
+PERSON_LABEL = 15
 
 FULL_LABEL_MAP = np.arange(len(LABEL_NAMES)).reshape(len(LABEL_NAMES), 1)
 FULL_COLOR_MAP = label_to_color_image(FULL_LABEL_MAP)
@@ -146,81 +139,76 @@ _MODEL_URLS = {
 }
 _TARBALL_NAME = _MODEL_URLS[MODEL_NAME]
 
-model_dir = 'deeplab_model'
-if not os.path.exists(model_dir):
-  tf.gfile.MakeDirs(model_dir)
-
-download_path = os.path.join(model_dir, _TARBALL_NAME)
-if not os.path.exists(download_path):
-  print('downloading model to %s, this might take a while...' % download_path)
-  urllib.request.urlretrieve(_DOWNLOAD_URL_PREFIX + _MODEL_URLS[MODEL_NAME], 
-			     download_path)
-  print('download completed! loading DeepLab model...')
-
-MODEL = DeepLabModel(download_path)
-print('model loaded successfully!')
-
-#######################################################################################
+MODEL_DIR = 'deeplab_model'
 
 
-#list_im=glob.glob(dir_name + '/*_img.png'); list_im.sort()
+def download_model(model_name=MODEL_NAME, model_dir=MODEL_DIR):
+	"""Downloads the DeepLab tarball of model_name if needed, returns its path."""
+	if not os.path.exists(model_dir):
+		tf.gfile.MakeDirs(model_dir)
 
+	download_path = os.path.join(model_dir, _MODEL_URLS[model_name])
+	if not os.path.exists(download_path):
+		print('downloading model to %s, this might take a while...' % download_path)
+		urllib.request.urlretrieve(_DOWNLOAD_URL_PREFIX + _MODEL_URLS[model_name],
+			download_path)
+		print('download completed! loading DeepLab model...')
+	return download_path
 
-#for i in range(0,len(list_im)):
 
-image = Image.open(dir_name)
-#print("Image Type = ",type(image))
-back = cv2.imread('sample_data/input/background.jpeg',cv2.IMREAD_COLOR)
+def remove_background(model, image):
+	"""Segments the person in image and whitens everything else.
 
+	Args:
+	  model: A DeepLabModel.
+	  image: A PIL.Image object, raw input image.
 
-res_im,seg=MODEL.run(image)
+	Returns:
+	  bg_removed: BGR image of the size of image with a white background.
+	"""
+	res_im,seg=model.run(image)
 
-seg=cv2.resize(seg.astype(np.uint8),image.size)
-mask_sel=(seg==15).astype(np.float32)
-mask = 255*mask_sel.astype(np.uint8)
+	seg=cv2.resize(seg.astype(np.uint8),image.size)
+	mask_sel=(seg==PERSON_LABEL).astype(np.float32)
+	mask = 255*mask_sel.astype(np.uint8)
 
-img = 	np.array(image)
-img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)   
+	img = 	np.array(image)
+	img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)   
 
-res = cv2.bitwise_and(img,img,mask = mask)
-bg_removed = res + (255 - cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)) 
-#cv2.imshow("original image",img)
-#cv2.imshow("mask",res)
-#cv2.imshow('input image',bg_removed)
-#cv2.waitKey(0)
+	res = cv2.bitwise_and(img,img,mask = mask)
+	bg_removed = res + (255 - cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)) 
+	#cv2.imshow("original image",img)
+	#cv2.imshow("mask",res)
+	#cv2.imshow('input image',bg_removed)
+	#cv2.waitKey(0)
+	return bg_removed
 
-#print("after processing = ",type(np.asarray(255*mask_sel)))
-#
-#
-#print("back type = ",type(back))
-#print("image type = ",type(np.asarray(image)))
-#print("masksDL type = ",type(255*mask_sel.astype(np.uint8)))
-#
-#
-#print("back shape = ", back.shape)
-#print("image shape = ",np.asarray(image).shape)
-#print("masksDL shape = ",255*mask_sel.astype(np.uint8).shape)
+#######################################################################################
 
-#back_align = alignImages(back, np.asarray(image), cv2.cvtColor(255*mask_sel.astype(np.uint8),cv2.COLOR_GRAY2RGB))
 
-#bg_removed = remove_bg(np.asarray(image), back_align,cv2.cvtColor(255*mask_sel.astype(np.uint8),cv2.COLOR_GRAY2RGB))
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Deeplab Segmentation')
+	parser.add_argument('-i', '--input_dir', type=str, required=True,help='Directory to save the output results. (required)')
+	parser.add_argument('-ht', '--height', type=int, required=True,help='Directory to save the output results. (required)')
+	parser.add_argument('-m', '--mesh_format', type=str, default=None, choices=['obj', 'ply', 'glb', 'npz'],help='Also save the reconstructed mesh in this format. (optional)')
+	parser.add_argument('-o', '--mesh_path', type=str, default=None,help='Where to save the mesh, defaults to test.<mesh_format>. (optional)')
+	parser.add_argument('-w', '--weight', action='store_true',help='Also estimate the body weight in kg. (optional)')
 
-#config = flags.FLAGS
-#config(sys.argv)
+	args=parser.parse_args()
 
-# Using pre-trained model, change this to use your own.
-#config.load_path = src.config.PRETRAINED_MODEL
-#
-#config.batch_size = 1
+	dir_name=args.input_dir;
 
-#cv2.imwrite(dir_name.replace('img','back'),remove_bg)
-main(bg_removed,args.height,None)
-#name= dir_name.replace('img','masksDL')
-#cv2.imwrite(name,(255*mask_sel).astype(np.uint8))
-#cv2.imwrite(dir_name.replace('img','back'),back_align)
+	MODEL = DeepLabModel(download_model())
+	print('model loaded successfully!')
 
+	image = Image.open(dir_name)
+	#print("Image Type = ",type(image))
 
-#str_msg='\nDone: ' + dir_name
-#print(str_msg)
+	bg_removed = remove_background(MODEL, image)
 
+	# Using pre-trained model, change this to use your own.
+	#config.load_path = src.config.PRETRAINED_MODEL
+	#
+	#config.batch_size = 1
 
+	main(bg_removed,args.height,None,args.mesh_format,args.mesh_path,return_weight=args.weight)
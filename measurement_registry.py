@@ -0,0 +1,145 @@
+import collections
+import numpy as np
+import utils
+import cross_section
+import extract_measurements as em
+
+
+# 'path' sums the segments of a control point path, 'distance' is the straight
+# line between two landmarks and 'circumference' is the perimeter of the
+# planar section through a closed control point loop
+KINDS = ('path', 'distance', 'circumference')
+# every measurement is scaled by the ratio of the given height to this one
+HEIGHT = 'height'
+
+Measurement = collections.namedtuple(
+    'Measurement', ['name', 'kind', 'points', 'factor', 'mode'])
+
+# measurements evaluated together: one sparse plan over the control points of
+# all of them, where each measurement sits in that plan, the circumferences
+# (output index, plan index) and the factor applied to every output
+FusedPlan = collections.namedtuple(
+    'FusedPlan', ['names', 'plan', 'index', 'sections', 'factors', 'modes'])
+
+
+_registry = collections.OrderedDict()
+_compiled = {}
+_defaults_loaded = False
+
+
+# register the measurements of customBodyPoints.txt under utils.M_STR
+def _load_defaults():
+  global _defaults_loaded
+  if _defaults_loaded:
+    return
+  _defaults_loaded = True
+  factors = dict(em.CORRECTIONS)
+  for i, points in enumerate(em.convert_cp()):
+    if utils.M_STR[i] not in _registry:
+      register(utils.M_STR[i], 'path', points, factors.get(i, 1.0))
+
+
+# declare a measurement by name, points are control points in the format of
+# customBodyPoints.txt. A distance takes two landmarks, a circumference a
+# closed loop whose fitted plane is used to cut the mesh (mode is one of
+# cross_section.SECTION_MODES).
+def register(name, kind, points, factor=1.0, mode='hull'):
+  if kind not in KINDS:
+    raise ValueError('Unknown measurement kind %s, expected one of %s'
+                     % (kind, ', '.join(KINDS)))
+  if kind == 'distance' and len(points) != 2:
+    raise ValueError('Distance %s needs exactly two landmarks' % name)
+  if kind == 'circumference':
+    if len(points) < 3:
+      raise ValueError('Circumference %s needs a loop of at least three points'
+                       % name)
+    if mode not in cross_section.SECTION_MODES:
+      raise ValueError('Unknown section mode %s, expected one of %s'
+                       % (mode, ', '.join(cross_section.SECTION_MODES)))
+  points = [list(map(float, p)) for p in points]
+  em.validate_points(points, name)
+  _registry[name] = Measurement(name, kind, points, float(factor), mode)
+  _compiled.clear()
+
+
+def unregister(name):
+  _load_defaults()
+  del _registry[name]
+  _compiled.clear()
+
+
+# names of all registered measurements, in registration order
+def registered():
+  _load_defaults()
+  return list(_registry.keys())
+
+
+# compile the requested measurements (all by default) into one fused plan,
+# plans are cached per set of names
+def compile_measurements(names=None):
+  _load_defaults()
+  names = tuple(registered() if names is None else names)
+  if names in _compiled:
+    return _compiled[names]
+  for name in names:
+    if name not in _registry:
+      raise KeyError('Unknown measurement %s, registered: %s'
+                     % (name, ', '.join(_registry)))
+  if HEIGHT not in _registry:
+    raise KeyError('Measurement %s is needed to scale the others' % HEIGHT)
+
+  # the height reference is always evaluated, as the last path of the plan
+  evaluated = [n for n in collections.OrderedDict.fromkeys(names) if n != HEIGHT]
+  evaluated.append(HEIGHT)
+  position = dict((n, i) for i, n in enumerate(evaluated))
+  measures = [_registry[n] for n in evaluated]
+
+  plan = em.compile_cp([m.points for m in measures])
+  index = np.array([position[n] for n in names], dtype=np.intp)
+  sections = [(i, position[n]) for i, n in enumerate(names)
+              if _registry[n].kind == 'circumference']
+  factors = np.array([_registry[n].factor for n in names])
+  modes = [_registry[n].mode for n in names]
+
+  fused = FusedPlan(names, plan, index, sections, factors, modes)
+  _compiled[names] = fused
+  return fused
+
+
+# raw lengths (mesh units) of the measurements of a fused plan on one (V, 3)
+# or many (..., V, 3) meshes, returns (..., len(names)) and the height
+def evaluate(fused, vertex):
+  vertex = np.asarray(vertex, dtype=np.float64)
+  plan = fused.plan
+  points = em.calc_path_points(plan, vertex)
+  length = em.calc_segment_length(plan, points)
+  out = length[..., fused.index]
+
+  if fused.sections:
+    ends = np.append(plan.starts[1:], points.shape[-2])
+    flat_out = out.reshape(-1, out.shape[-1])
+    flat_vertex = vertex.reshape((-1,) + vertex.shape[-2:])
+    flat_points = points.reshape((-1,) + points.shape[-2:])
+    for n in range(flat_vertex.shape[0]):
+      for i, p in fused.sections:
+        center, normal = cross_section.fit_plane(
+            flat_points[n, plan.starts[p]:ends[p]])
+        flat_out[n, i] = cross_section.calc_perimeter(
+            flat_vertex[n], center, normal, mode=fused.modes[i])
+  return out, length[..., -1]
+
+
+# measurements (cm) of one (V, 3) or many (..., V, 3) meshes scaled to the
+# given (...) heights, returns (..., len(names)) in the order of names
+def measure(vertex, height, names=None):
+  fused = compile_measurements(names)
+  length, reference = evaluate(fused, vertex)
+  height = np.asarray(height, dtype=np.float64)[..., None]
+  return height * (length / reference[..., None]) * fused.factors
+
+
+# measurements of a single mesh as an ordered name -> value mapping
+def measure_dict(vertex, height, names=None):
+  fused = compile_measurements(names)
+  return collections.OrderedDict(
+      zip(fused.names, measure(vertex, height, fused.names).tolist()))
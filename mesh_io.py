@@ -0,0 +1,131 @@
+import os
+import io
+import json
+import struct
+import contextlib
+import numpy as np
+
+
+FACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'src', 'tf_smpl', 'smpl_faces.npy')
+MESH_FORMATS = ('obj', 'ply', 'glb', 'npz')
+MESH_CONTENT_TYPES = {'obj': 'text/plain',
+                      'ply': 'application/octet-stream',
+                      'glb': 'model/gltf-binary',
+                      'npz': 'application/octet-stream'}
+
+
+_faces = None
+
+# SMPL faces (F_NUM x 3, 0-based) loaded once per process
+def get_faces():
+  global _faces
+  if _faces is None:
+    _faces = np.load(FACE_PATH)
+  return _faces
+
+
+# every writer takes a file name or a binary file-like object (an open file,
+# io.BytesIO, an HTTP response stream, ...) which is left open
+@contextlib.contextmanager
+def _open(target):
+  if isinstance(target, str):
+    with open(target, 'wb') as fp:
+      yield fp
+  else:
+    yield target
+
+
+# save obj file, faces are 0-based and written 1-based. The whole file is
+# formatted in two % operations instead of one write per line.
+def save_obj(target, v, f):
+  v = np.asarray(v, dtype=np.float64).reshape(-1, 3)
+  f = np.asarray(f, dtype=np.int64).reshape(-1, 3) + 1
+  with _open(target) as fp:
+    fp.write((('v %f %f %f\n' * len(v)) % tuple(v.ravel().tolist())).encode('ascii'))
+    fp.write((('f %d %d %d\n' * len(f)) % tuple(f.ravel().tolist())).encode('ascii'))
+
+
+# save binary little endian ply file with float32 vertices and int32 faces
+def save_ply(target, v, f):
+  header = ('ply\n'
+            'format binary_little_endian 1.0\n'
+            'element vertex %d\n'
+            'property float x\n'
+            'property float y\n'
+            'property float z\n'
+            'element face %d\n'
+            'property list uchar int vertex_indices\n'
+            'end_header\n' % (len(v), len(f)))
+  face = np.empty(len(f), dtype=[('n', 'u1'), ('idx', '<i4', (3,))])
+  face['n'] = 3
+  face['idx'] = f
+  with _open(target) as fp:
+    fp.write(header.encode('ascii'))
+    fp.write(np.ascontiguousarray(v, dtype='<f4').tobytes())
+    fp.write(face.tobytes())
+
+
+# save binary glTF 2.0 file holding a single triangle mesh
+def save_glb(target, v, f):
+  v = np.ascontiguousarray(v, dtype='<f4').reshape(-1, 3)
+  f = np.ascontiguousarray(f, dtype='<u4').reshape(-1, 3)
+  gltf = {
+      'asset': {'version': '2.0'},
+      'scene': 0,
+      'scenes': [{'nodes': [0]}],
+      'nodes': [{'mesh': 0}],
+      'meshes': [{'primitives': [
+          {'attributes': {'POSITION': 0}, 'indices': 1, 'mode': 4}]}],
+      'buffers': [{'byteLength': v.nbytes + f.nbytes}],
+      'bufferViews': [
+          {'buffer': 0, 'byteOffset': 0, 'byteLength': v.nbytes,
+           'target': 34962},
+          {'buffer': 0, 'byteOffset': v.nbytes, 'byteLength': f.nbytes,
+           'target': 34963}],
+      'accessors': [
+          {'bufferView': 0, 'componentType': 5126, 'count': len(v),
+           'type': 'VEC3', 'min': v.min(axis=0).tolist(),
+           'max': v.max(axis=0).tolist()},
+          {'bufferView': 1, 'componentType': 5125, 'count': f.size,
+           'type': 'SCALAR'}],
+  }
+  chunk = json.dumps(gltf, separators=(',', ':')).encode('ascii')
+  chunk += b' ' * (-len(chunk) % 4)
+  # vertex and face buffers are multiples of 4 bytes, no padding needed
+  length = 12 + 8 + len(chunk) + 8 + v.nbytes + f.nbytes
+  with _open(target) as fp:
+    fp.write(struct.pack('<4sII', b'glTF', 2, length))
+    fp.write(struct.pack('<I4s', len(chunk), b'JSON'))
+    fp.write(chunk)
+    fp.write(struct.pack('<I4s', v.nbytes + f.nbytes, b'BIN\0'))
+    fp.write(v.tobytes())
+    fp.write(f.tobytes())
+
+
+# save vertices and faces as numpy arrays
+def save_npz(target, v, f):
+  with _open(target) as fp:
+    np.savez(fp, vertices=np.asarray(v, dtype=np.float32),
+             faces=np.asarray(f, dtype=np.int32))
+
+
+# save a mesh in one of MESH_FORMATS, by default the SMPL faces are used and
+# the format is taken from the file extension
+def save_mesh(target, v, f=None, mesh_format=None):
+  if f is None:
+    f = get_faces()
+  if mesh_format is None and isinstance(target, str):
+    mesh_format = os.path.splitext(target)[1][1:].lower()
+  if mesh_format not in MESH_FORMATS:
+    raise ValueError('Unknown mesh format %s, expected one of %s'
+                     % (mesh_format, ', '.join(MESH_FORMATS)))
+  {'obj': save_obj, 'ply': save_ply, 'glb': save_glb,
+   'npz': save_npz}[mesh_format](target, v, f)
+
+
+# serialize a mesh to bytes, e.g. for an HTTP response body
+def mesh_bytes(v, f=None, mesh_format='glb'):
+  buf = io.BytesIO()
+  save_mesh(buf, v, f, mesh_format=mesh_format)
+  return buf.getvalue()
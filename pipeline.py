@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import demo
+import inference
+import mesh_io
+import shape_measurements
+import extract_measurements as em
+from src.RunModel import RunModel, make_model
+from src.util.session import make_session
+from src.batcher import MicroBatcher
+
+
+# loads the DeepLab segmentation graph, the HMR graph with its checkpoint and
+# the SMPL / measurement assets once, then measures any number of images.
+# Each graph has its own session, so several pipelines can live in one process.
+# frozen_path runs the HMR graph exported by src.freeze instead of restoring
+# the checkpoint, backend='onnx' (or HMR_BACKEND=onnx) runs it with ONNX
+# Runtime, see src.onnx_backend. With max_batch_size, measure can be called
+# from many threads and their crops share predict_dict calls (src.batcher).
+#
+#   pipeline = MeasurementPipeline()
+#   for path, height in people:
+#     measure = pipeline.measure(path, height)
+class MeasurementPipeline(object):
+
+  def __init__(self, deeplab_path=None, shape_only=False, frozen_path=None,
+               backend=None, max_batch_size=None, max_wait=0.01):
+    if deeplab_path is None:
+      deeplab_path = inference.download_model()
+    self.deeplab = inference.DeepLabModel(deeplab_path)
+
+    if backend is None:
+      backend = os.environ.get('HMR_BACKEND', 'tf')
+    self.sess = None
+    if backend == 'tf':
+      self.graph = tf.Graph()
+      with self.graph.as_default():
+        self.sess = make_session(graph=self.graph)
+        self.model = RunModel(sess=self.sess, frozen_path=frozen_path)
+    else:
+      self.model = make_model(backend)
+    self.batcher = None
+    if max_batch_size is not None:
+      self.batcher = MicroBatcher(self.model, max_batch_size, max_wait)
+      self.model = self.batcher
+
+    # measurement plan and mesh faces are cached per process
+    em.get_plan()
+    mesh_io.get_faces()
+    self.shape_only = shape_only
+    if shape_only:
+      shape_measurements.get_shape_basis()
+
+  # image is a file name, a PIL image or an RGB array. Returns the (M_NUM, 1)
+  # measurements of utils.M_STR and, with return_weight, the weight (kg), see
+  # demo.main for the other arguments.
+  def measure(self, image, height, mesh_format=None, mesh_path=None,
+              shape_only=None, return_weight=False):
+    if isinstance(image, np.ndarray):
+      image = Image.fromarray(image)
+    elif not isinstance(image, Image.Image):
+      image = Image.open(image)
+    if shape_only is None:
+      shape_only = self.shape_only
+
+    bg_removed = inference.remove_background(self.deeplab, image)
+    return demo.main(bg_removed, height, None, mesh_format, mesh_path,
+                     shape_only, model=self.model, return_weight=return_weight)
+
+  def close(self):
+    if self.batcher is not None:
+      self.batcher.close()
+    if self.sess is not None:
+      self.sess.close()
+    self.deeplab.sess.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
@@ -0,0 +1,76 @@
+import os
+import collections
+import numpy as np
+import extract_measurements as em
+from src.tf_smpl import smpl_cache
+
+
+SMPL_MODEL_PATH = os.path.join('models', 'neutral_smpl_with_cocoplus_reg.pkl')
+NUM_CAM = 3
+NUM_POSE = 72
+
+# control points of the T-posed shaped mesh are linear in the betas:
+# points + basis . beta, with points (P, 3) and basis (P, 3, num_betas)
+ShapeBasis = collections.namedtuple('ShapeBasis', ['points', 'basis'])
+
+
+# v_template (V, 3) and shapedirs (V, 3, num_betas) of an SMPL model
+def load_shape_model(pkl_path=SMPL_MODEL_PATH):
+  dd = smpl_cache.load_model(pkl_path)
+  return (np.asarray(smpl_cache.undo_chumpy(dd['v_template']), dtype=np.float64),
+          np.asarray(smpl_cache.undo_chumpy(dd['shapedirs']), dtype=np.float64))
+
+
+# project the shape model onto the control points of a measurement plan
+def compile_shape_basis(plan, v_template, shapedirs):
+  num_vertex, _, num_betas = shapedirs.shape
+  points = plan.interp.dot(v_template)
+  basis = plan.interp.dot(shapedirs.reshape(num_vertex, -1))
+  return ShapeBasis(points, basis.reshape(-1, 3, num_betas))
+
+
+_shape_model = None
+_basis = None
+
+# shape model and its control point basis, loaded once per process
+def get_shape_basis():
+  global _shape_model, _basis
+  if _basis is None:
+    _shape_model = load_shape_model()
+    _basis = compile_shape_basis(em.get_plan(), *_shape_model)
+  return _basis
+
+
+# T-posed shaped vertices (N, V, 3) of (N, num_betas) betas
+def shaped_vertices(betas):
+  get_shape_basis()
+  v_template, shapedirs = _shape_model
+  return v_template + np.einsum('vcb,nb->nvc', shapedirs, betas)
+
+
+# betas (N, num_betas) from (N, 85) theta = [camera, pose, shape]
+def theta_to_betas(theta):
+  return np.asarray(theta)[:, NUM_CAM + NUM_POSE:]
+
+
+# measurements (N, M_NUM) float32 of the T-posed shaped meshes of (N, num_betas)
+# betas scaled to (N,) heights. The path method never builds the vertices, the
+# section methods (see extract_measurements.METHODS) need the full mesh, as
+# does return_weight, which also returns the (N,) float32 weights.
+def measure_betas(heights, betas, method='path', return_weight=False):
+  betas = np.atleast_2d(np.asarray(betas, dtype=np.float64))
+  heights = np.asarray(heights, dtype=np.float64).reshape(-1)
+  plan = em.get_plan()
+  vertices = None
+  if method != 'path' or return_weight:
+    vertices = shaped_vertices(betas)
+  if method == 'path':
+    basis = get_shape_basis()
+    points = basis.points + np.einsum('pcb,nb->npc', basis.basis, betas)
+    length = em.calc_segment_length(plan, points)
+  else:
+    length = em.calc_length(plan, vertices, method)
+  measure = em.scale_measure(length, heights, plan, method).astype(np.float32)
+  if return_weight:
+    return measure, em.calc_weight(plan, vertices, heights).astype(np.float32)
+  return measure
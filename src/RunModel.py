@@ -4,6 +4,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 import tensorflow as tf
 import numpy as np
 from os.path import exists
@@ -11,12 +12,53 @@ from os.path import exists
 from .tf_smpl import projection as proj_util
 from .tf_smpl.batch_smpl import SMPL
 from .models import get_encoder_fn_separate
+from .util.session import make_session
+
+# Names of the input and outputs of the inference graph, used to freeze it
+# (see src.freeze) and to run the frozen graph.
+INPUT_NAME = 'input_images'
+OUTPUT_NAMES = {
+    'joints': 'output_joints',
+    'verts': 'output_verts',
+    'cams': 'output_cams',
+    'joints3d': 'output_joints3d',
+    'theta': 'output_theta',
+}
+FROZEN_PATH = 'models/hmr_frozen.pb'
+# Inference backends of make_model, the default is read from HMR_BACKEND.
+BACKENDS = ('tf', 'onnx')
+
+
+def make_model(backend=None, **kwargs):
+    """
+    Returns the model of the given backend, all with the same predict and
+    predict_dict:
+      'tf': RunModel(**kwargs)
+      'onnx': onnx_backend.OnnxModel(**kwargs), ONNX Runtime on CPU
+    """
+    if backend is None:
+        backend = os.environ.get('HMR_BACKEND', 'tf')
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend %s, expected one of %s'
+                         % (backend, ', '.join(BACKENDS)))
+    if backend == 'onnx':
+        from .onnx_backend import OnnxModel
+        return OnnxModel(**kwargs)
+    return RunModel(**kwargs)
+
 
 class RunModel(object):
-    def __init__(self, sess=None):
+    def __init__(self, sess=None, all_stages=False, frozen_path=None):
         """
         Args:
           config
+          all_stages: if True, builds the mesh, joints and 2D keypoints of
+            every IEF stage in all_verts, all_Js and all_kps. By default only
+            the final stage runs SMPL, the outputs of predict_dict are the same.
+          frozen_path: if set, runs the frozen graph written by src.freeze
+            (e.g. FROZEN_PATH) instead of building the graph and restoring
+            the checkpoint. It is imported in the graph of sess, or in a new
+            graph if sess is None.
         """
 #        self.config = config
 
@@ -35,15 +77,20 @@ class RunModel(object):
 #            ipdb.set_trace()
 
         # Data
-        self.batch_size = 1#config.batch_size
+        # The batch dimension is dynamic: any number of images per run.
         self.img_size = 224#config.img_size
  
 
         self.data_format = 'NHMC'
         self.smpl_model_path = 'models/neutral_smpl_with_cocoplus_reg.pkl'#config.smpl_model_path
+
+        if frozen_path is not None:
+            self.load_frozen(frozen_path, sess)
+            return
         
-        input_size = (self.batch_size, self.img_size, self.img_size, 3)
-        self.images_pl = tf.placeholder(tf.float32, shape=input_size)
+        input_size = (None, self.img_size, self.img_size, 3)
+        self.images_pl = tf.placeholder(
+            tf.float32, shape=input_size, name=INPUT_NAME)
 
         # Model Settings
         self.num_stage = 3#config.num_stage
@@ -65,10 +112,10 @@ class RunModel(object):
         #     self.load_mean_param(), shape=[self.batch_size, self.total_params], name='theta0')
         # self.theta0_pl = tf.placeholder(tf.float32, shape=[None, self.total_params], name='theta0')
 
-        self.build_test_model_ief()
+        self.build_test_model_ief(all_stages=all_stages)
 
         if sess is None:
-            self.sess = tf.Session()
+            self.sess = make_session()
         else:
             self.sess = sess
         
@@ -77,7 +124,7 @@ class RunModel(object):
         self.prepare()        
 
 
-    def build_test_model_ief(self):
+    def build_test_model_ief(self, all_stages=False):
         # Load mean value
         self.mean_var = tf.Variable(tf.zeros((1, self.total_params)), name="mean_param", dtype=tf.float32)
 
@@ -93,7 +140,7 @@ class RunModel(object):
         self.all_cams = []
         self.all_Js = []
         self.final_thetas = []
-        theta_prev = tf.tile(self.mean_var, [self.batch_size, 1])
+        theta_prev = tf.tile(self.mean_var, [tf.shape(self.images_pl)[0], 1])
         for i in np.arange(self.num_stage):
             print('Iteration %d' % i)
             # ---- Compute outputs
@@ -119,19 +166,55 @@ class RunModel(object):
             poses = theta_here[:, self.num_cam:(self.num_cam + self.num_theta)]
             shapes = theta_here[:, (self.num_cam + self.num_theta):]
 
-            verts, Js, _ = self.smpl(shapes, poses, get_skin=True)
+            # Intermediate stages only feed theta to the next regressor
+            # iteration, SMPL and the projection run on the final one.
+            if all_stages or i == self.num_stage - 1:
+                verts, Js, _ = self.smpl(shapes, poses, get_skin=True)
 
-            # Project to 2D!
-            pred_kp = self.proj_fn(Js, cams, name='proj_2d_stage%d' % i)
-            self.all_verts.append(verts)
-            self.all_kps.append(pred_kp)
+                # Project to 2D!
+                pred_kp = self.proj_fn(Js, cams, name='proj_2d_stage%d' % i)
+                self.all_verts.append(verts)
+                self.all_kps.append(pred_kp)
+                self.all_Js.append(Js)
             self.all_cams.append(cams)
-            self.all_Js.append(Js)
             # save each theta.
             self.final_thetas.append(theta_here)
             # Finally)update to end iteration.
             theta_prev = theta_here
 
+        # Named outputs of the final stage.
+        self.outputs = {
+            'joints': self.all_kps[-1],
+            'verts': self.all_verts[-1],
+            'cams': self.all_cams[-1],
+            'joints3d': self.all_Js[-1],
+            'theta': self.final_thetas[-1],
+        }
+        self.outputs = dict(
+            (key, tf.identity(value, name=OUTPUT_NAMES[key]))
+            for key, value in self.outputs.items())
+
+    def load_frozen(self, frozen_path, sess=None):
+        """
+        Imports the frozen graph at frozen_path, all weights and SMPL
+        constants are in the GraphDef so nothing is restored.
+        """
+        print('Loading frozen graph %s..' % frozen_path)
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(frozen_path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        if sess is None:
+            sess = make_session(graph=tf.Graph())
+        self.sess = sess
+        with self.sess.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        graph = self.sess.graph
+        self.images_pl = graph.get_tensor_by_name(INPUT_NAME + ':0')
+        self.outputs = dict(
+            (key, graph.get_tensor_by_name(name + ':0'))
+            for key, name in OUTPUT_NAMES.items())
+
 
     def prepare(self):
         print('Restoring checkpoint %s..' % self.load_path)
@@ -161,15 +244,7 @@ class RunModel(object):
             self.images_pl: images,
             # self.theta0_pl: self.mean_var,
         }
-        fetch_dict = {
-            'joints': self.all_kps[-1],
-            'verts': self.all_verts[-1],
-            'cams': self.all_cams[-1],
-            'joints3d': self.all_Js[-1],
-            'theta': self.final_thetas[-1],
-        }
-
-        results = self.sess.run(fetch_dict, feed_dict)
+        results = self.sess.run(self.outputs, feed_dict)
 
         # Return joints in original image space.
         joints = results['joints']
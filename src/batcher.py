@@ -0,0 +1,152 @@
+"""
+Micro-batching in front of a model's predict_dict.
+
+Requests arrive one image at a time from concurrent callers, while RunModel
+(and OnnxModel) cost much less per image on a batch. MicroBatcher queues the
+preprocessed img_size x img_size crops, and a single thread runs one
+predict_dict per batch, flushed as soon as max_batch_size crops are queued
+or max_wait seconds after the first one, then hands every caller its own
+row of each output.
+
+    batcher = MicroBatcher(RunModel())
+    # from any thread:
+    joints, verts, cams, joints3d, theta = batcher.predict(crop[None], True)
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import queue
+import threading
+from time import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher(object):
+    def __init__(self, model, max_batch_size=32, max_wait=0.01, img_size=224):
+        """
+        Args:
+          model: anything with predict_dict(images), e.g. RunModel
+          max_batch_size: largest batch given to predict_dict
+          max_wait: seconds the first queued crop waits for others
+          img_size: crops must be img_size x img_size x 3
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.crop_shape = (img_size, img_size, 3)
+        self.queue = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='MicroBatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, image):
+        """
+        Queues one img_size x img_size x 3 crop, returns a Future of its
+        predict_dict results (one row of every output).
+        Raises ValueError for a crop of another shape (so it cannot fail the
+        batch it would join) and RuntimeError once closed.
+        """
+        image = np.asarray(image, np.float32)
+        if image.shape != self.crop_shape:
+            raise ValueError('Expected a %s crop, got %s' %
+                             ('x'.join(map(str, self.crop_shape)),
+                              'x'.join(map(str, image.shape))))
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('MicroBatcher is closed')
+            self.queue.put((image, future))
+        return future
+
+    def predict_dict(self, images):
+        """
+        Same as the model's predict_dict, the images are batched with those
+        of the other callers.
+        """
+        if len(images) == 0:
+            raise ValueError('predict_dict needs at least one image')
+        futures = [self.submit(image) for image in images]
+        results = [future.result() for future in futures]
+        return dict((key, np.stack([res[key] for res in results]))
+                    for key in results[0])
+
+    def predict(self, images, get_theta=False):
+        results = self.predict_dict(images)
+        if get_theta:
+            return results['joints'], results['verts'], results['cams'], results[
+                'joints3d'], results['theta']
+        else:
+            return results['joints'], results['verts'], results['cams'], results[
+                'joints3d']
+
+    def next_batch(self):
+        """
+        Blocks for the first crop, then collects more until the batch is
+        full or max_wait has passed. Returns None once closed.
+        """
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, stop on the next call.
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            # Drop the crops whose callers cancelled.
+            batch = [(image, future) for image, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            images, futures = zip(*batch)
+            try:
+                results = self.model.predict_dict(np.stack(images))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for i, future in enumerate(futures):
+                future.set_result(
+                    dict((key, value[i]) for key, value in results.items()))
+
+    def close(self):
+        """
+        Serves the crops queued so far, then stops the batching thread. Any
+        crop left in the queue (e.g. if the thread died) fails with
+        RuntimeError, later submits raise it.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError('MicroBatcher is closed'))
@@ -18,13 +18,12 @@ from time import time
 from os.path import exists, join, expanduser, split
 from os import makedirs
 
-import tensorflow as tf
-
 from src.config import get_config
 from ..util import renderer as vis_util
 from ..RunModel import RunModel
 from .eval_util import compute_errors
 from ..datasets.common import read_images_from_tfrecords
+from ..util.session import make_session
 
 kPredDir = '/tmp/hmr_output'
 # Change to where you saved your tfrecords
@@ -125,7 +124,7 @@ def get_data(seq_name, config):
     """
     global sess
     if sess is None:
-        sess = tf.Session()
+        sess = make_session()
 
     tf_path = join(
         expanduser(config.tfh36m_dir), 'test', seq_name + '.tfrecord')
@@ -156,25 +155,9 @@ def run_model(images, config):
         end_ind = (b + 1) * batch_size
         images_here = images[start_ind:end_ind]
 
-        if end_ind > N:
-            end_ind = N
-            # Need to pad dummy bc batch size is not dynamic,,
-            num_here = images_here.shape[0]
-            images_wdummy = np.vstack([
-                images_here,
-                np.zeros((batch_size - num_here, config.img_size,
-                          config.img_size, 3))
-            ])
-            joints, verts, cams, joints3d, thetas = model.predict(
-                images_wdummy, get_theta=True)
-            joints = joints[:num_here]
-            verts = verts[:num_here]
-            cams = cams[:num_here]
-            joints3d = joints3d[:num_here]
-            thetas = thetas[:num_here]
-        else:
-            joints, verts, cams, joints3d, thetas = model.predict(
-                images_here, get_theta=True)
+        # The batch size is dynamic, the last batch may be smaller.
+        joints, verts, cams, joints3d, thetas = model.predict(
+            images_here, get_theta=True)
 
         all_joints.append(joints)
         all_verts.append(verts)
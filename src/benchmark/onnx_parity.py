@@ -0,0 +1,92 @@
+"""
+Parity and latency check of the ONNX Runtime backend against the TF RunModel.
+
+Runs both backends on the same sample images and reports the largest
+difference of every predict_dict output and the latency of each backend.
+Exits with status 1 if theta differs by more than --tol.
+tests/test_onnx_parity.py runs the same check with PARITY_TOL under pytest.
+
+Sample call:
+python -m src.benchmark.onnx_parity --img_dir sample_data/input
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import argparse
+from time import time
+
+import numpy as np
+
+from ..RunModel import make_model
+from ..onnx_backend import ONNX_PATH
+from ..util.image import load_crops
+
+OUTPUTS = ['theta', 'cams', 'joints', 'joints3d', 'verts']
+# largest accepted theta difference, the default of --tol
+PARITY_TOL = 1e-3
+
+
+def max_diffs(tf_res, onnx_res):
+    """ Largest absolute difference of every output in OUTPUTS. """
+    return dict((key, np.abs(tf_res[key] - onnx_res[key]).max())
+                for key in OUTPUTS)
+
+
+def time_model(model, images, num_runs):
+    """ Median seconds per image at batch size 1 and for the whole batch. """
+    model.predict_dict(images[:1])  # warm up
+    single = []
+    for _ in range(num_runs):
+        t0 = time()
+        for image in images:
+            model.predict_dict(image[None])
+        single.append((time() - t0) / len(images))
+    batch = []
+    for _ in range(num_runs):
+        t0 = time()
+        model.predict_dict(images)
+        batch.append((time() - t0) / len(images))
+    return np.median(single), np.median(batch)
+
+
+def main(args):
+    paths, images = load_crops(args.img_dir)
+    print('%d images from %s' % (len(paths), args.img_dir))
+
+    tf_model = make_model('tf')
+    onnx_model = make_model(
+        'onnx', onnx_path=args.onnx_path, num_threads=args.num_threads)
+
+    tf_res = tf_model.predict_dict(images)
+    onnx_res = onnx_model.predict_dict(images)
+    for key in OUTPUTS:
+        diff = np.abs(tf_res[key] - onnx_res[key])
+        print('%-8s max abs diff %.3g, mean %.3g' % (key, diff.max(),
+                                                     diff.mean()))
+
+    for name, model in [('tf', tf_model), ('onnx', onnx_model)]:
+        single, batch = time_model(model, images, args.num_runs)
+        print('%-4s %.1f ms/image at batch 1, %.1f ms/image at batch %d' %
+              (name, 1000 * single, 1000 * batch, len(images)))
+
+    theta_diff = max_diffs(tf_res, onnx_res)['theta']
+    if theta_diff > args.tol:
+        print('FAILED: theta differs by %g > %g' % (theta_diff, args.tol))
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--img_dir', default='sample_data/input')
+    parser.add_argument('--onnx_path', default=ONNX_PATH)
+    parser.add_argument('--num_threads', type=int, default=None,
+                        help='Intra-op threads of ONNX Runtime.')
+    parser.add_argument('--num_runs', type=int, default=5)
+    parser.add_argument('--tol', type=float, default=PARITY_TOL,
+                        help='Largest accepted theta difference.')
+    sys.exit(main(parser.parse_args()))
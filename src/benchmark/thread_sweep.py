@@ -0,0 +1,135 @@
+"""
+Throughput of worker x thread layouts on this host.
+
+For every layout WxT, starts W worker processes, each pinned to its own T
+CPUs and running the model with T intra-op threads and one inter-op thread
+(see util.session), and counts the images all workers predict in --duration
+seconds. Prints one line per layout, images/s for the whole host.
+
+Sample call, on a 16 core host:
+python -m src.benchmark.thread_sweep --layouts 1x16,2x8,4x4,8x2,16x1
+python -m src.benchmark.thread_sweep --backend onnx --layouts 4x4,8x2
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import queue
+import argparse
+import multiprocessing
+from time import time
+
+import numpy as np
+
+from ..util.session import INTRA_OP_ENV, INTER_OP_ENV, AFFINITY_ENV
+
+
+def parse_layouts(spec):
+    """ [(workers, threads)] of a "1x16,4x4" style list. """
+    return [tuple(int(n) for n in layout.split('x'))
+            for layout in spec.split(',')]
+
+
+def worker(cpus, threads, backend, batch_size, duration, barrier, counts,
+           load_timeout):
+    os.environ[INTRA_OP_ENV] = str(threads)
+    os.environ[INTER_OP_ENV] = '1'
+    if cpus is not None:
+        os.environ[AFFINITY_ENV] = ','.join(str(cpu) for cpu in cpus)
+
+    if backend == 'onnx':
+        # Without TensorFlow, as on the CPU-only hosts.
+        from ..onnx_backend import OnnxModel
+        model = OnnxModel()
+    else:
+        from ..RunModel import make_model
+        model = make_model(backend)
+    images = np.random.uniform(
+        -1, 1, (batch_size, 224, 224, 3)).astype(np.float32)
+    model.predict_dict(images)  # warm up
+
+    barrier.wait(load_timeout)
+    num_images = 0
+    t0 = time()
+    while time() - t0 < duration:
+        model.predict_dict(images)
+        num_images += batch_size
+    counts.put(num_images)
+
+
+def run_layout(num_workers, threads, backend, batch_size, duration,
+               load_timeout=600.):
+    """
+    Images per second of num_workers workers with threads threads. Raises
+    RuntimeError if a worker dies or the layout does not finish within
+    load_timeout + duration seconds.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    host_cpus = sorted(os.sched_getaffinity(0))
+    pin = num_workers * threads <= len(host_cpus)
+    if not pin:
+        print('%dx%d needs more than the %d CPUs of the host, not pinning' %
+              (num_workers, threads, len(host_cpus)))
+
+    barrier = ctx.Barrier(num_workers)
+    counts = ctx.Queue()
+    workers = []
+    for i in range(num_workers):
+        cpus = host_cpus[i * threads:(i + 1) * threads] if pin else None
+        p = ctx.Process(
+            target=worker,
+            args=(cpus, threads, backend, batch_size, duration, barrier,
+                  counts, load_timeout))
+        p.start()
+        workers.append(p)
+
+    deadline = time() + load_timeout + duration
+    total = 0
+    received = 0
+    while received < num_workers:
+        try:
+            total += counts.get(timeout=1)
+            received += 1
+            continue
+        except queue.Empty:
+            pass
+        failed = [p.exitcode for p in workers
+                  if p.exitcode is not None and p.exitcode != 0]
+        if failed or time() > deadline:
+            for p in workers:
+                p.terminate()
+                p.join()
+            if failed:
+                raise RuntimeError('%d of %d workers failed, exit codes %s' %
+                                   (len(failed), num_workers, failed))
+            raise RuntimeError('%dx%d did not finish in %g s' %
+                               (num_workers, threads,
+                                load_timeout + duration))
+    for p in workers:
+        p.join(timeout=60)
+        if p.exitcode != 0:
+            raise RuntimeError('Worker exited with %s' % p.exitcode)
+    return total / duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--layouts', default='1x%d' % os.cpu_count(),
+                        help='Comma separated WORKERSxTHREADS layouts.')
+    parser.add_argument('--backend', default='tf', choices=['tf', 'onnx'])
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=30.,
+                        help='Seconds every layout runs for.')
+    parser.add_argument('--load_timeout', type=float, default=600.,
+                        help='Seconds the workers may take to load the model.')
+    args = parser.parse_args()
+
+    print('%d CPUs, backend %s, batch size %d' %
+          (len(os.sched_getaffinity(0)), args.backend, args.batch_size))
+    for num_workers, threads in parse_layouts(args.layouts):
+        rate = run_layout(num_workers, threads, args.backend, args.batch_size,
+                          args.duration, args.load_timeout)
+        print('%3d workers x %2d threads: %8.1f images/s' %
+              (num_workers, threads, rate))
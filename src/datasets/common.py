@@ -9,6 +9,8 @@ from __future__ import print_function
 import tensorflow as tf
 import numpy as np
 
+from ..util.session import make_session
+
 
 class ImageCoder(object):
     """Helper class that provides TensorFlow image coding utilities.
@@ -242,7 +244,7 @@ def read_images_from_tfrecords(tf_path, img_size=224, sess=None):
         exit(1)
 
     if sess is None:
-        sess = tf.Session()
+        sess = make_session()
 
     t0 = time()
     all_images, all_kps, all_gt3ds = [], [], []
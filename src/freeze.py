@@ -0,0 +1,83 @@
+"""
+Exports the HMR inference graph as a frozen, inference-optimized GraphDef.
+
+Builds RunModel, restores its checkpoint, turns every variable (encoder
+weights, mean theta, SMPL model arrays) into a constant and runs the graph
+transforms:
+- strip_unused_nodes: keeps only what the named outputs need,
+- fold_constants: precomputes everything that does not depend on the images,
+- fold_batch_norms / fold_old_batch_norms: folds the batchnorms that follow
+  a convolution into its weights.
+The encoder is built with is_training=False, so slim.dropout is already the
+identity and no dropout op reaches the graph.
+
+Load it with RunModel(frozen_path=...).
+
+Usage:
+python -m src.freeze --out_path models/hmr_frozen.pb
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+from .RunModel import RunModel, INPUT_NAME, OUTPUT_NAMES, FROZEN_PATH
+
+TRANSFORMS = [
+    'strip_unused_nodes(type=float, shape="-1,224,224,3")',
+    'remove_nodes(op=CheckNumerics)',
+    'fold_constants(ignore_errors=true)',
+    'fold_batch_norms',
+    'fold_old_batch_norms',
+    'fold_constants(ignore_errors=true)',
+    'sort_by_execution_order',
+]
+
+
+def freeze_graph_def(outputs=None, transforms=TRANSFORMS):
+    """
+    Returns the frozen, transformed GraphDef of RunModel computing the
+    given keys of OUTPUT_NAMES (all by default).
+    """
+    if outputs is None:
+        outputs = sorted(OUTPUT_NAMES)
+    output_names = [OUTPUT_NAMES[key] for key in outputs]
+
+    graph = tf.Graph()
+    with graph.as_default():
+        sess = tf.Session(graph=graph)
+        RunModel(sess=sess)
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            sess, graph.as_graph_def(), output_names)
+        sess.close()
+
+    num_nodes = len(graph_def.node)
+    graph_def = TransformGraph(
+        graph_def, [INPUT_NAME], output_names, transforms)
+    print('Frozen graph: %d nodes, %d after the transforms' %
+          (num_nodes, len(graph_def.node)))
+    return graph_def
+
+
+def freeze_model(out_path=FROZEN_PATH, transforms=TRANSFORMS):
+    """
+    Writes the frozen graph of RunModel to out_path, returns its GraphDef.
+    """
+    graph_def = freeze_graph_def(transforms=transforms)
+    with tf.gfile.GFile(out_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    print('Wrote %s' % out_path)
+    return graph_def
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out_path', default=FROZEN_PATH,
+                        help='Where to write the frozen GraphDef.')
+    args = parser.parse_args()
+    freeze_model(args.out_path)
@@ -0,0 +1,150 @@
+"""
+ONNX Runtime backend of RunModel for CPU-only hosts.
+
+The ResNet encoder and the IEF regressor are exported to ONNX from the frozen
+graph of src.freeze (image -> theta). SMPL and the camera projection run in
+NumPy with np_smpl, which computes the same outputs as the TF SMPL layer
+(and avoids sparse ops that have no ONNX equivalent). Running it needs
+onnxruntime but not TensorFlow, exporting needs TensorFlow and tf2onnx.
+
+Export:
+python -m src.onnx_backend --out_path models/hmr.onnx
+
+Then select it with RunModel.make_model(backend='onnx') or HMR_BACKEND=onnx,
+and check it with python -m src.benchmark.onnx_parity.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+
+import numpy as np
+
+from .tf_smpl.np_smpl import SMPL
+from .util.session import INTRA_OP_ENV, INTER_OP_ENV, env_threads, pin_cpus
+
+ONNX_PATH = 'models/hmr.onnx'
+ONNX_OPSET = 9
+
+
+def export_onnx(out_path=ONNX_PATH, opset=ONNX_OPSET):
+    """
+    Writes the encoder + IEF regressor of RunModel (images -> theta) as an
+    ONNX model to out_path.
+    """
+    import tensorflow as tf
+    from tf2onnx import tfonnx, optimizer
+    from .freeze import freeze_graph_def
+    from .RunModel import INPUT_NAME, OUTPUT_NAMES
+
+    graph_def = freeze_graph_def(outputs=['theta'])
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        onnx_graph = tfonnx.process_tf_graph(
+            graph,
+            opset=opset,
+            input_names=[INPUT_NAME + ':0'],
+            output_names=[OUTPUT_NAMES['theta'] + ':0'])
+    onnx_graph = optimizer.optimize_graph(onnx_graph)
+    model = onnx_graph.make_model('hmr')
+    with open(out_path, 'wb') as f:
+        f.write(model.SerializeToString())
+    print('Wrote %s' % out_path)
+    return out_path
+
+
+def orth_proj(X, camera):
+    """
+    NumPy batch_orth_proj_idrot.
+    X is N x num_points x 3, camera is N x 3
+    """
+    camera = camera[:, None, :]
+    return camera[:, :, :1] * (X[:, :, :2] + camera[:, :, 1:])
+
+
+class OnnxModel(object):
+    """
+    Same predict / predict_dict as RunModel, run by ONNX Runtime.
+    """
+
+    def __init__(self, onnx_path=ONNX_PATH, num_threads=None, cpus=None):
+        """
+        Args:
+          onnx_path: model written by export_onnx
+          num_threads: intra-op threads of the ONNX Runtime session,
+            HMR_INTRA_OP_THREADS by default. ONNX Runtime picks one per
+            physical core if neither is set.
+          cpus: CPUs to pin the process to, see util.session.pin_cpus.
+        """
+        import onnxruntime as ort
+
+        self.img_size = 224
+        self.num_cam = 3
+        self.num_theta = 72
+        self.joint_type = 'cocoplus'
+        self.smpl_model_path = 'models/neutral_smpl_with_cocoplus_reg.pkl'
+
+        pin_cpus(cpus)
+        if num_threads is None:
+            num_threads = env_threads(INTRA_OP_ENV)
+        inter_op = env_threads(INTER_OP_ENV)
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        if inter_op is not None:
+            options.inter_op_num_threads = inter_op
+        options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        print('Loading ONNX model %s..' % onnx_path)
+        self.sess = ort.InferenceSession(onnx_path, options)
+        self.input_name = self.sess.get_inputs()[0].name
+
+        self.smpl = SMPL(self.smpl_model_path, joint_type=self.joint_type)
+
+    def predict(self, images, get_theta=False):
+        """
+        images: num_batch, img_size, img_size, 3
+        Preprocessed to range [-1, 1]
+        """
+        results = self.predict_dict(images)
+        if get_theta:
+            return results['joints'], results['verts'], results['cams'], results[
+                'joints3d'], results['theta']
+        else:
+            return results['joints'], results['verts'], results['cams'], results[
+                'joints3d']
+
+    def predict_dict(self, images):
+        """
+        images: num_batch, img_size, img_size, 3
+        Preprocessed to range [-1, 1]
+        Runs the model with images.
+        """
+        theta = self.sess.run(
+            None, {self.input_name: np.asarray(images, np.float32)})[0]
+        cams = theta[:, :self.num_cam]
+        poses = theta[:, self.num_cam:(self.num_cam + self.num_theta)]
+        shapes = theta[:, (self.num_cam + self.num_theta):]
+
+        verts, joints3d, _ = self.smpl(shapes, poses, get_skin=True)
+        joints = orth_proj(joints3d, cams)
+
+        # Return joints in original image space.
+        return {
+            'joints': ((joints + 1) * 0.5) * self.img_size,
+            'verts': verts,
+            'cams': cams,
+            'joints3d': joints3d,
+            'theta': theta,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out_path', default=ONNX_PATH,
+                        help='Where to write the ONNX model.')
+    parser.add_argument('--opset', type=int, default=ONNX_OPSET)
+    args = parser.parse_args()
+    export_onnx(args.out_path, args.opset)
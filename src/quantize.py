@@ -0,0 +1,136 @@
+"""
+Post-training int8 quantization of the ONNX HMR model (src.onnx_backend).
+
+The ResNet-50 encoder is most of the cost of the model. Its convolutions and
+the regressor matmuls are quantized to int8 (per-channel weights, QDQ format)
+with activation ranges calibrated on a folder of our own images, cropped as
+at inference time.
+
+The float and int8 models are then run on the evaluation images and the
+report gives, for every measurement of utils.M_STR, the mean and largest
+absolute difference (cm) and the mean relative difference, plus the
+throughput of both models.
+
+Sample call, from the repository root:
+python -m src.quantize --calib_dir <images> --eval_dir sample_data/input
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+from time import time
+
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat,
+                                      QuantType, quantize_static)
+
+import utils
+import extract_measurements as em
+from .onnx_backend import OnnxModel, ONNX_PATH
+from .util.image import load_crops
+
+INT8_PATH = 'models/hmr_int8.onnx'
+
+
+class ImageFolderReader(CalibrationDataReader):
+    """
+    Feeds the cropped images of img_dir to the calibration one at a time.
+    """
+
+    def __init__(self, img_dir, input_name, max_images=None):
+        paths, images = load_crops(img_dir)
+        if max_images is not None:
+            images = images[:max_images]
+        print('Calibrating on %d images from %s' % (len(images), img_dir))
+        self.input_name = input_name
+        self.images = iter(images.astype(np.float32))
+
+    def get_next(self):
+        image = next(self.images, None)
+        if image is None:
+            return None
+        return {self.input_name: image[None]}
+
+
+def quantize_model(calib_dir, onnx_path=ONNX_PATH, out_path=INT8_PATH,
+                   max_images=None):
+    """
+    Writes the int8 version of the ONNX model at onnx_path to out_path.
+    """
+    input_name = ort.InferenceSession(onnx_path).get_inputs()[0].name
+    reader = ImageFolderReader(calib_dir, input_name, max_images)
+    quantize_static(
+        onnx_path,
+        out_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8)
+    print('Wrote %s' % out_path)
+    return out_path
+
+
+def measure_images(model, images, height):
+    """
+    Measurements (N x M_NUM) of the images at the given height and the
+    seconds per image.
+    """
+    model.predict_dict(images[:1])  # warm up
+    t0 = time()
+    verts = model.predict_dict(images)['verts']
+    seconds = (time() - t0) / len(images)
+    heights = np.full(len(images), height)
+    return em.extract_measurements_batch(heights, verts), seconds
+
+
+def accuracy_report(eval_dir, onnx_path=ONNX_PATH, int8_path=INT8_PATH,
+                    height=175., num_threads=None):
+    """
+    Prints the measurement differences between the float and int8 models on
+    the images of eval_dir, returns them per M_STR field.
+    """
+    paths, images = load_crops(eval_dir)
+    float_measure, float_time = measure_images(
+        OnnxModel(onnx_path, num_threads), images, height)
+    int8_measure, int8_time = measure_images(
+        OnnxModel(int8_path, num_threads), images, height)
+
+    diff = np.abs(int8_measure - float_measure)
+    rel = diff / np.maximum(np.abs(float_measure), 1e-6)
+    print('%d images from %s, height %g cm' % (len(paths), eval_dir, height))
+    print('%-16s %10s %10s %10s' % ('measurement', 'mean (cm)', 'max (cm)',
+                                    'mean (%)'))
+    report = {}
+    for i, name in enumerate(utils.M_STR):
+        report[name] = (diff[:, i].mean(), diff[:, i].max(), rel[:, i].mean())
+        print('%-16s %10.3f %10.3f %10.2f' % (name, report[name][0],
+                                              report[name][1],
+                                              100 * report[name][2]))
+    print('float %.1f ms/image, int8 %.1f ms/image (%.2fx)' %
+          (1000 * float_time, 1000 * int8_time, float_time / int8_time))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calib_dir', required=True,
+                        help='Images used to calibrate the activation ranges.')
+    parser.add_argument('--eval_dir', default=None,
+                        help='Images of the accuracy report, '
+                        'defaults to calib_dir.')
+    parser.add_argument('--onnx_path', default=ONNX_PATH)
+    parser.add_argument('--out_path', default=INT8_PATH)
+    parser.add_argument('--max_images', type=int, default=None)
+    parser.add_argument('--height', type=float, default=175.,
+                        help='Height (cm) the measurements are scaled to.')
+    parser.add_argument('--num_threads', type=int, default=None)
+    args = parser.parse_args()
+
+    quantize_model(args.calib_dir, args.onnx_path, args.out_path,
+                   args.max_images)
+    accuracy_report(args.eval_dir or args.calib_dir, args.onnx_path,
+                    args.out_path, args.height, args.num_threads)
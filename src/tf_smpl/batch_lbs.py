@@ -9,32 +9,29 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
+from .np_lbs import kintree_levels
+
 
 def batch_skew(vec, batch_size=None):
     """
     vec is N x 3, batch_size is int
 
     returns N x 3 x 3. Skew_sym version of each matrix.
+    batch_size is unused, the batch dimension is taken from vec.
     """
     with tf.name_scope("batch_skew", [vec]):
-        if batch_size is None:
-            batch_size = vec.shape.as_list()[0]
-        col_inds = tf.constant([1, 2, 3, 5, 6, 7])
-        indices = tf.reshape(
-            tf.reshape(tf.range(0, batch_size) * 9, [-1, 1]) + col_inds,
-            [-1, 1])
-        updates = tf.reshape(
-            tf.stack(
-                [
-                    -vec[:, 2], vec[:, 1], vec[:, 2], -vec[:, 0], -vec[:, 1],
-                    vec[:, 0]
-                ],
-                axis=1), [-1])
-        out_shape = [batch_size * 9]
-        res = tf.scatter_nd(indices, updates, out_shape)
-        res = tf.reshape(res, [batch_size, 3, 3])
+        zeros = tf.zeros_like(vec[:, 0])
+        res = tf.stack(
+            [
+                zeros, -vec[:, 2], vec[:, 1],
+                vec[:, 2], zeros, -vec[:, 0],
+                -vec[:, 1], vec[:, 0], zeros
+            ],
+            axis=1)
+        res = tf.reshape(res, [-1, 3, 3])
 
         return res
 
@@ -42,26 +39,28 @@ def batch_skew(vec, batch_size=None):
 def batch_rodrigues(theta, name=None):
     """
     Theta is N x 3
+
+    R = cos * I + (1 - cos) * r r^T + sin * skew(r), written out entry by
+    entry (no scatter, no tiled identity). The 1e-8 offset keeps the angle
+    away from zero, where R tends to the identity.
     """
     with tf.name_scope(name, "batch_rodrigues", [theta]):
-        batch_size = theta.shape.as_list()[0]
-
-        # angle = tf.norm(theta, axis=1)
-        # r = tf.expand_dims(tf.div(theta, tf.expand_dims(angle + 1e-8, -1)), -1)
-        # angle = tf.expand_dims(tf.norm(theta, axis=1) + 1e-8, -1)
-        angle = tf.expand_dims(tf.norm(theta + 1e-8, axis=1), -1)
-        r = tf.expand_dims(tf.div(theta, angle), -1)
+        angle = tf.norm(theta + 1e-8, axis=1)
+        r = tf.div(theta, tf.expand_dims(angle, -1))
+        rx, ry, rz = r[:, 0], r[:, 1], r[:, 2]
 
-        angle = tf.expand_dims(angle, -1)
         cos = tf.cos(angle)
         sin = tf.sin(angle)
+        t = 1 - cos
 
-        outer = tf.matmul(r, r, transpose_b=True, name="outer")
-
-        eyes = tf.tile(tf.expand_dims(tf.eye(3), 0), [batch_size, 1, 1])
-        R = cos * eyes + (1 - cos) * outer + sin * batch_skew(
-            r, batch_size=batch_size)
-        return R
+        R = tf.stack(
+            [
+                cos + t * rx * rx, t * rx * ry - sin * rz, t * rx * rz + sin * ry,
+                t * rx * ry + sin * rz, cos + t * ry * ry, t * ry * rz - sin * rx,
+                t * rx * rz - sin * ry, t * ry * rz + sin * rx, cos + t * rz * rz
+            ],
+            axis=1)
+        return tf.reshape(R, [-1, 3, 3])
 
 
 def batch_lrotmin(theta, name=None):
@@ -88,24 +87,30 @@ def batch_lrotmin(theta, name=None):
         return lrotmin
 
 
-def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False):
+def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False,
+                                      levels=None):
     """
     Computes absolute joint locations given pose.
 
     rotate_base: if True, rotates the global rotation by 90 deg in x axis.
     if False, this is the original SMPL coordinate.
 
+    The chain is evaluated one depth of the kinematic tree at a time: all
+    joints at the same depth are composed with their parents in one batched
+    matmul.
+
     Args:
       Rs: N x 24 x 3 x 3 rotation vector of K joints
       Js: N x 24 x 3, joint locations before posing
       parent: 24 holding the parent id for each index
+      levels: np_lbs.kintree_levels(parent), computed here if None
 
     Returns
       new_J : `Tensor`: N x 24 x 3 location of absolute joints
       A     : `Tensor`: N x 24 4 x 4 relative joint transformations for LBS.
     """
     with tf.name_scope("batch_forward_kinematics", [Rs, Js]):
-        N = Rs.shape[0].value
+        N = tf.shape(Rs)[0]
         if rotate_base:
             print('Flipping the SMPL coordinate frame!!!!')
             rot_x = tf.constant(
@@ -118,24 +123,35 @@ def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False):
         # Now Js is N x 24 x 3 x 1
         Js = tf.expand_dims(Js, -1)
 
+        if levels is None:
+            levels = kintree_levels(parent)
+
         def make_A(R, t, name=None):
-            # Rs is N x 3 x 3, ts is N x 3 x 1
+            # Rs is N x K x 3 x 3, ts is N x K x 3 x 1
             with tf.name_scope(name, "Make_A", [R, t]):
-                R_homo = tf.pad(R, [[0, 0], [0, 1], [0, 0]])
-                t_homo = tf.concat([t, tf.ones([N, 1, 1])], 1)
-                return tf.concat([R_homo, t_homo], 2)
-
-        A0 = make_A(root_rotation, Js[:, 0])
-        results = [A0]
-        for i in range(1, parent.shape[0]):
-            j_here = Js[:, i] - Js[:, parent[i]]
-            A_here = make_A(Rs[:, i], j_here)
+                R_homo = tf.pad(R, [[0, 0], [0, 0], [0, 1], [0, 0]])
+                t_homo = tf.concat([t, tf.ones_like(t[:, :, :1])], 2)
+                return tf.concat([R_homo, t_homo], 3)
+
+        # Local transforms of all joints: root at its location, the others
+        # relative to their parent. N x 24 x 4 x 4
+        j_rel = tf.concat(
+            [Js[:, :1], Js[:, 1:] - tf.gather(Js, parent[1:], axis=1)], 1)
+        R_all = tf.concat([tf.expand_dims(root_rotation, 1), Rs[:, 1:]], 1)
+        A_local = make_A(R_all, j_rel)
+
+        level_results = [tf.gather(A_local, levels[0][0], axis=1)]
+        for d, (joints, parent_pos) in enumerate(levels[1:], 1):
             res_here = tf.matmul(
-                results[parent[i]], A_here, name="propA%d" % i)
-            results.append(res_here)
+                tf.gather(level_results[-1], parent_pos, axis=1),
+                tf.gather(A_local, joints, axis=1),
+                name="propA_level%d" % d)
+            level_results.append(res_here)
 
-        # 10 x 24 x 4 x 4
-        results = tf.stack(results, axis=1)
+        # Back to joint order: N x 24 x 4 x 4
+        order = np.concatenate([joints for joints, _ in levels])
+        results = tf.gather(
+            tf.concat(level_results, 1), np.argsort(order), axis=1)
 
         new_J = results[:, :, :3, 3]
 
@@ -143,7 +159,7 @@ def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False):
         # how much the bone moved (not the final location of the bone)
         # but (final_bone - init_bone)
         # ---
-        Js_w0 = tf.concat([Js, tf.zeros([N, 24, 1, 1])], 2)
+        Js_w0 = tf.concat([Js, tf.zeros_like(Js[:, :, :1])], 2)
         init_bone = tf.matmul(results, Js_w0)
         # Append empty 4 x 3:
         init_bone = tf.pad(init_bone, [[0, 0], [0, 0], [0, 0], [3, 0]])
@@ -11,25 +11,59 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-import pickle as pickle
 
 import tensorflow as tf
 from .batch_lbs import batch_rodrigues, batch_global_rigid_transformation
-
-
-# There are chumpy variables so convert them to numpy.
-def undo_chumpy(x):
-    return x if isinstance(x, np.ndarray) else x.r
+from .np_lbs import topk_skinning_weights, kintree_levels
+from .smpl_cache import load_model, undo_chumpy
+
+
+def sparse_regressor(regressor, dtype=tf.float32, num_rows=None):
+    """
+    Converts a scipy sparse K x 6890 regressor to a K x 6890 tf.SparseTensor,
+    keeping only the first num_rows rows if given.
+    """
+    regressor = regressor.tocsr()
+    if num_rows is not None:
+        regressor = regressor[:num_rows]
+    regressor = regressor.tocoo()
+    return tf.SparseTensor(
+        indices=np.stack([regressor.row, regressor.col], axis=1).astype(np.int64),
+        values=regressor.data.astype(dtype.as_numpy_dtype),
+        dense_shape=regressor.shape)
+
+
+def batch_regress(regressor, verts, name=None):
+    """
+    Applies a K x 6890 sparse regressor to all coordinates of all meshes in a
+    single sparse product.
+    Args:
+      regressor: K x 6890 tf.SparseTensor
+      verts: N x 6890 x 3
+    Returns:
+      N x K x 3
+    """
+    with tf.name_scope(name, "batch_regress", [verts]):
+        num_out, num_verts = regressor.get_shape().as_list()
+        # 6890 x N*3
+        flat = tf.reshape(tf.transpose(verts, [1, 0, 2]), [num_verts, -1])
+        res = tf.sparse_tensor_dense_matmul(regressor, flat)
+        return tf.transpose(tf.reshape(res, [num_out, -1, 3]), [1, 0, 2])
 
 
 class SMPL(object):
-    def __init__(self, pkl_path, joint_type='cocoplus', dtype=tf.float32):
+    def __init__(self, pkl_path, joint_type='cocoplus', dtype=tf.float32,
+                 skin_topk=None):
         """
         pkl_path is the path to a SMPL model
+        skin_topk: if set (1 to 4), skins every vertex with only its
+          skin_topk most influential joints, see
+          np_lbs.topk_skinning_weights for the error bound. self.skin_residual
+          holds the weight mass dropped at every vertex.
         """
         # -- Load SMPL params --
-        with open(pkl_path, 'rb') as f:
-            dd = pickle.load(f, encoding="latin-1") 
+        # (memory-mapped when smpl_cache.convert_model has been run)
+        dd = load_model(pkl_path)
         # Mean template vertices
         self.v_template = tf.Variable(
             undo_chumpy(dd['v_template']),
@@ -46,12 +80,8 @@ class SMPL(object):
         self.shapedirs = tf.Variable(
             shapedir, name='shapedirs', dtype=dtype, trainable=False)
 
-        # Regressor for joint locations given shape - 6890 x 24
-        self.J_regressor = tf.Variable(
-            dd['J_regressor'].T.todense(),
-            name="J_regressor",
-            dtype=dtype,
-            trainable=False)
+        # Sparse regressor for joint locations given shape - 24 x 6890
+        self.J_regressor = sparse_regressor(dd['J_regressor'], dtype)
 
         # Pose blend shape basis: 6890 x 3 x 207, reshaped to 6890*30 x 207
         num_pose_basis = dd['posedirs'].shape[-1]
@@ -63,6 +93,8 @@ class SMPL(object):
 
         # indices of parents for each joints
         self.parents = dd['kintree_table'][0].astype(np.int32)
+        # joints grouped by depth in the kinematic tree
+        self.levels = kintree_levels(self.parents)
 
         # LBS weights
         self.weights = tf.Variable(
@@ -70,28 +102,36 @@ class SMPL(object):
             name='lbs_weights',
             dtype=dtype,
             trainable=False)
-
-        # This returns 19 keypoints: 6890 x 19
-        self.joint_regressor = tf.Variable(
-            dd['cocoplus_regressor'].T.todense(),
-            name="cocoplus_regressor",
-            dtype=dtype,
-            trainable=False)
-        if joint_type == 'lsp':  # 14 LSP joints!
-            self.joint_regressor = self.joint_regressor[:, :14]
+        self.skin_topk = skin_topk
+        if skin_topk is not None:
+            # 6890 x k joint indices and weights
+            skin_idx, skin_w, self.skin_residual = topk_skinning_weights(
+                undo_chumpy(dd['weights']), skin_topk)
+            self.skin_idx = tf.constant(skin_idx, name='lbs_topk_idx')
+            self.skin_w = tf.constant(
+                skin_w[:, :, None], name='lbs_topk_weights', dtype=dtype)
+
+        # This returns 19 keypoints: 19 x 6890, sparse
+        # 14 LSP joints are the first 14 rows
+        self.joint_regressor = sparse_regressor(
+            dd['cocoplus_regressor'], dtype,
+            num_rows=14 if joint_type == 'lsp' else None)
 
         if joint_type not in ['cocoplus', 'lsp']:
             print('BAD!! Unknown joint type: %s, it must be either "cocoplus" or "lsp"' % joint_type)
             import ipdb
             ipdb.set_trace()
 
-    def __call__(self, beta, theta, get_skin=False, name=None):
+    def __call__(self, beta, theta, get_skin=False, name=None,
+                 shape_only=False):
         """
         Obtain SMPL with shape (beta) & pose (theta) inputs.
         Theta includes the global rotation.
         Args:
           beta: N x 10
           theta: N x 72 (with 3-D axis-angle rep)
+          shape_only: if True, theta is ignored and the T-posed shaped mesh
+            is returned without the pose blend shapes and skinning.
 
         Updates:
         self.J_transformed: N x 24 x 3 joint location after shaping
@@ -100,10 +140,13 @@ class SMPL(object):
           - joints: N x 19 or 14 x 3 joint locations depending on joint_type
         If get_skin is True, also returns
           - Verts: N x 6980 x 3
+        If shape_only is True, returns
+          - Verts: N x 6980 x 3 T-posed shaped mesh
+          - joints: N x 19 or 14 x 3 joint locations on that mesh
         """
 
         with tf.name_scope(name, "smpl_main", [beta, theta]):
-            num_batch = beta.shape[0].value
+            num_batch = tf.shape(beta)[0]
 
             # 1. Add shape blend shapes
             # (N x 10) x (10 x 6890*3) = N x 6890 x 3
@@ -112,10 +155,13 @@ class SMPL(object):
                 [-1, self.size[0], self.size[1]]) + self.v_template
 
             # 2. Infer shape-dependent joint locations.
-            Jx = tf.matmul(v_shaped[:, :, 0], self.J_regressor)
-            Jy = tf.matmul(v_shaped[:, :, 1], self.J_regressor)
-            Jz = tf.matmul(v_shaped[:, :, 2], self.J_regressor)
-            J = tf.stack([Jx, Jy, Jz], axis=2)
+            J = batch_regress(self.J_regressor, v_shaped, name='J_regress')
+
+            if shape_only:
+                self.J_transformed = J
+                joints = batch_regress(
+                    self.joint_regressor, v_shaped, name='joint_regress')
+                return v_shaped, joints
 
             # 3. Add pose blend shapes
             # N x 24 x 3 x 3
@@ -132,27 +178,34 @@ class SMPL(object):
                 [-1, self.size[0], self.size[1]]) + v_shaped
 
             #4. Get the global joint location
-            self.J_transformed, A = batch_global_rigid_transformation(Rs, J, self.parents)
+            self.J_transformed, A = batch_global_rigid_transformation(
+                Rs, J, self.parents, levels=self.levels)
 
             # 5. Do skinning:
-            # W is N x 6890 x 24
-            W = tf.reshape(
-                tf.tile(self.weights, [num_batch, 1]), [num_batch, -1, 24])
-            # (N x 6890 x 24) x (N x 24 x 16)
-            T = tf.reshape(
-                tf.matmul(W, tf.reshape(A, [num_batch, 24, 16])),
-                [num_batch, -1, 4, 4])
+            if self.skin_topk is None:
+                # W is N x 6890 x 24
+                W = tf.reshape(
+                    tf.tile(self.weights, [num_batch, 1]), [num_batch, -1, 24])
+                # (N x 6890 x 24) x (N x 24 x 16)
+                T = tf.reshape(
+                    tf.matmul(W, tf.reshape(A, [num_batch, 24, 16])),
+                    [num_batch, self.size[0], 4, 4])
+            else:
+                # (N x 6890 x k x 16) weighted by (6890 x k x 1)
+                A_vert = tf.gather(
+                    tf.reshape(A, [num_batch, 24, 16]), self.skin_idx, axis=1)
+                T = tf.reshape(
+                    tf.reduce_sum(A_vert * self.skin_w, axis=2),
+                    [num_batch, self.size[0], 4, 4])
             v_posed_homo = tf.concat(
-                [v_posed, tf.ones([num_batch, v_posed.shape[1], 1])], 2)
+                [v_posed, tf.ones_like(v_posed[:, :, :1])], 2)
             v_homo = tf.matmul(T, tf.expand_dims(v_posed_homo, -1))
 
             verts = v_homo[:, :, :3, 0]
 
             # Get cocoplus or lsp joints:
-            joint_x = tf.matmul(verts[:, :, 0], self.joint_regressor)
-            joint_y = tf.matmul(verts[:, :, 1], self.joint_regressor)
-            joint_z = tf.matmul(verts[:, :, 2], self.joint_regressor)
-            joints = tf.stack([joint_x, joint_y, joint_z], axis=2)
+            joints = batch_regress(
+                self.joint_regressor, verts, name='joint_regress')
 
             if get_skin:
                 return verts, joints, Rs
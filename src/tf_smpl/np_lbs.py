@@ -0,0 +1,163 @@
+""" NumPy versions of the SMPL util functions in batch_lbs.
+@@batch_skew
+@@batch_rodrigues
+@@batch_global_rigid_transformation
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def batch_skew(vec):
+    """
+    vec is N x 3
+
+    returns N x 3 x 3. Skew_sym version of each matrix.
+    """
+    zeros = np.zeros_like(vec[:, 0])
+    res = np.stack(
+        [
+            zeros, -vec[:, 2], vec[:, 1],
+            vec[:, 2], zeros, -vec[:, 0],
+            -vec[:, 1], vec[:, 0], zeros
+        ],
+        axis=1)
+    return res.reshape(-1, 3, 3)
+
+
+def batch_rodrigues(theta):
+    """
+    Theta is N x 3
+
+    Same closed form as batch_lbs.batch_rodrigues:
+    R = cos * I + (1 - cos) * r r^T + sin * skew(r), entry by entry.
+    """
+    angle = np.linalg.norm(theta + 1e-8, axis=1)
+    r = theta / angle[:, None]
+    rx, ry, rz = r[:, 0], r[:, 1], r[:, 2]
+
+    cos = np.cos(angle)
+    sin = np.sin(angle)
+    t = 1 - cos
+
+    R = np.stack(
+        [
+            cos + t * rx * rx, t * rx * ry - sin * rz, t * rx * rz + sin * ry,
+            t * rx * ry + sin * rz, cos + t * ry * ry, t * ry * rz - sin * rx,
+            t * rx * rz - sin * ry, t * ry * rz + sin * rx, cos + t * rz * rz
+        ],
+        axis=1)
+    return R.reshape(-1, 3, 3)
+
+
+def kintree_levels(parent):
+    """
+    Groups the joints of a kinematic tree by depth, parents are assumed to
+    come before their children (as in the SMPL kintree_table).
+
+    Returns a list with one (joints, parent_pos) pair per depth: the joint
+    indices at that depth and the position of each joint's parent in the
+    previous depth's joints. The root level has parent_pos None.
+    """
+    parent = np.asarray(parent)
+    depth = np.zeros(len(parent), dtype=np.int64)
+    for i in range(1, len(parent)):
+        depth[i] = depth[parent[i]] + 1
+    levels = [(np.array([0]), None)]
+    for d in range(1, depth.max() + 1):
+        joints = np.flatnonzero(depth == d)
+        parent_pos = np.searchsorted(levels[-1][0], parent[joints])
+        levels.append((joints, parent_pos))
+    return levels
+
+
+def batch_global_rigid_transformation(Rs, Js, parent, rotate_base=False,
+                                      levels=None):
+    """
+    Computes absolute joint locations given pose.
+
+    rotate_base: if True, rotates the global rotation by 90 deg in x axis.
+    if False, this is the original SMPL coordinate.
+
+    The chain is evaluated one depth of the kinematic tree at a time.
+
+    Args:
+      Rs: N x 24 x 3 x 3 rotation vector of K joints
+      Js: N x 24 x 3, joint locations before posing
+      parent: 24 holding the parent id for each index
+      levels: kintree_levels(parent), computed here if None
+
+    Returns
+      new_J : `ndarray`: N x 24 x 3 location of absolute joints
+      A     : `ndarray`: N x 24 4 x 4 relative joint transformations for LBS.
+    """
+    N = Rs.shape[0]
+    if rotate_base:
+        rot_x = np.array(
+            [[1, 0, 0], [0, -1, 0], [0, 0, -1]], dtype=Rs.dtype)
+        root_rotation = np.matmul(Rs[:, 0, :, :], rot_x)
+    else:
+        root_rotation = Rs[:, 0, :, :]
+
+    if levels is None:
+        levels = kintree_levels(parent)
+
+    # Local transforms of all joints: root at its location, the others
+    # relative to their parent. N x 24 x 4 x 4
+    A_local = np.zeros((N, parent.shape[0], 4, 4), dtype=Rs.dtype)
+    A_local[:, 0, :3, :3] = root_rotation
+    A_local[:, 1:, :3, :3] = Rs[:, 1:]
+    A_local[:, 0, :3, 3] = Js[:, 0]
+    A_local[:, 1:, :3, 3] = Js[:, 1:] - Js[:, parent[1:]]
+    A_local[:, :, 3, 3] = 1
+
+    results = np.empty_like(A_local)
+    results[:, 0] = A_local[:, 0]
+    prev = levels[0][0]
+    for joints, parent_pos in levels[1:]:
+        results[:, joints] = np.matmul(
+            results[:, prev[parent_pos]], A_local[:, joints])
+        prev = joints
+
+    new_J = results[:, :, :3, 3]
+
+    # --- Compute relative A: Skinning is based on
+    # how much the bone moved (not the final location of the bone)
+    # but (final_bone - init_bone)
+    # ---
+    init_bone = np.matmul(results[:, :, :3, :3], Js[:, :, :, None])[..., 0]
+    A = results.copy()
+    A[:, :, :3, 3] -= init_bone
+
+    return new_J, A
+
+
+def topk_skinning_weights(weights, k):
+    """
+    Keeps the k largest LBS weights of every vertex, renormalized to sum to 1.
+
+    With r the weight mass dropped at a vertex and G_j the transformed
+    position of the vertex under joint j alone, the skinned vertex moves by
+        |v_topk - v_full| <= r * max_{i,j} |G_i - G_j|
+    i.e. at most the dropped mass times the spread of the joints it mixes
+    (0 in the rest pose).
+
+    Args:
+      weights: 6890 x 24 LBS weights
+      k: number of joints kept per vertex, 1 <= k <= 4
+
+    Returns
+      idx      : 6890 x k joint indices
+      w        : 6890 x k weights
+      residual : 6890 dropped weight mass r of every vertex
+    """
+    if not 1 <= k <= 4:
+        raise ValueError('Top-k skinning needs 1 <= k <= 4, got %d' % k)
+    idx = np.argsort(-weights, axis=1)[:, :k].astype(np.int32)
+    w = np.take_along_axis(weights, idx, axis=1)
+    kept = w.sum(axis=1)
+    residual = weights.sum(axis=1) - kept
+    return idx, w / kept[:, None], residual
@@ -0,0 +1,203 @@
+"""
+NumPy SMPL implementation as batch, same model and outputs as batch_smpl.SMPL
+without TensorFlow.
+Specify joint types:
+'coco': Returns COCO+ 19 joints
+'lsp': Returns H3.6M-LSP 14 joints
+Note: To get original smpl joints, use self.J_transformed
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import functools
+
+import numpy as np
+import scipy.sparse as sp
+
+from .np_lbs import batch_rodrigues, batch_global_rigid_transformation
+from .np_lbs import topk_skinning_weights, kintree_levels
+from .smpl_cache import load_model, undo_chumpy
+
+
+def batch_regress(regressor, verts):
+    """
+    Applies a K x 6890 sparse regressor to all coordinates of all meshes in a
+    single sparse product: N x 6890 x 3 -> N x K x 3
+    """
+    num_batch, num_verts, _ = verts.shape
+    flat = np.transpose(verts, [1, 0, 2]).reshape(num_verts, -1)
+    res = regressor.dot(flat).reshape(-1, num_batch, 3)
+    return np.transpose(res, [1, 0, 2])
+
+
+class SMPL(object):
+    def __init__(self, pkl_path, joint_type='cocoplus', dtype=np.float32,
+                 skin_topk=None, shape_cache_size=1024, shape_cache_decimals=4):
+        """
+        pkl_path is the path to a SMPL model
+        skin_topk: if set (1 to 4), skins every vertex with only its
+          skin_topk most influential joints, see
+          np_lbs.topk_skinning_weights for the error bound. self.skin_residual
+          holds the weight mass dropped at every vertex.
+        shape_cache_size: number of T-posed shaped meshes kept by shaped(),
+          keyed by the betas rounded to shape_cache_decimals.
+        """
+        if joint_type not in ['cocoplus', 'lsp']:
+            raise ValueError(
+                'Unknown joint type: %s, it must be either "cocoplus" or "lsp"'
+                % joint_type)
+        self.dtype = dtype
+
+        # -- Load SMPL params --
+        # (memory-mapped when smpl_cache.convert_model has been run, the
+        # float32 arrays below are then views of the shared mapping)
+        dd = load_model(pkl_path)
+        # Mean template vertices
+        self.v_template = np.asarray(undo_chumpy(dd['v_template']), dtype)
+        # Size of mesh [Number of vertices, 3]
+        self.size = [self.v_template.shape[0], 3]
+        self.num_betas = dd['shapedirs'].shape[-1]
+        # Shape blend shape basis: 6980 x 3 x 10
+        # reshaped to 6980*30 x 10, transposed to 10x6980*3
+        self.shapedirs = np.asarray(
+            np.reshape(undo_chumpy(dd['shapedirs']), [-1, self.num_betas]).T,
+            dtype)
+
+        # Sparse regressor for joint locations given shape - 24 x 6890
+        self.J_regressor = sp.csr_matrix(dd['J_regressor'], dtype=dtype)
+
+        # Pose blend shape basis: 6890 x 3 x 207, reshaped to 6890*30 x 207
+        num_pose_basis = dd['posedirs'].shape[-1]
+        # 207 x 20670
+        self.posedirs = np.asarray(
+            np.reshape(undo_chumpy(dd['posedirs']), [-1, num_pose_basis]).T,
+            dtype)
+
+        # indices of parents for each joints
+        self.parents = dd['kintree_table'][0].astype(np.int32)
+        # joints grouped by depth in the kinematic tree
+        self.levels = kintree_levels(self.parents)
+
+        # LBS weights
+        self.weights = np.asarray(undo_chumpy(dd['weights']), dtype)
+        self.skin_topk = skin_topk
+        if skin_topk is not None:
+            # 6890 x k joint indices and weights
+            self.skin_idx, skin_w, self.skin_residual = topk_skinning_weights(
+                self.weights, skin_topk)
+            self.skin_w = skin_w[:, :, None]
+
+        # This returns 19 keypoints: 19 x 6890, sparse
+        self.joint_regressor = sp.csr_matrix(
+            dd['cocoplus_regressor'], dtype=dtype)
+        if joint_type == 'lsp':  # 14 LSP joints!
+            self.joint_regressor = self.joint_regressor[:14]
+
+        self.shape_cache_decimals = shape_cache_decimals
+        self._shaped_cached = functools.lru_cache(maxsize=shape_cache_size)(
+            self._shaped_one)
+
+    def _shaped_one(self, key):
+        """
+        T-posed shaped mesh (6890 x 3), its SMPL joints (24 x 3) and
+        cocoplus/lsp joints of one rounded beta, read-only as they are cached.
+        """
+        beta = np.array(key, dtype=self.dtype)[None]
+        v_shaped = np.reshape(
+            beta.dot(self.shapedirs),
+            [-1, self.size[0], self.size[1]]) + self.v_template
+        J = batch_regress(self.J_regressor, v_shaped)
+        joints = batch_regress(self.joint_regressor, v_shaped)
+        out = (v_shaped[0], J[0], joints[0])
+        for x in out:
+            x.flags.writeable = False
+        return out
+
+    def shaped(self, beta):
+        """
+        Shape-only evaluation: no pose blend shapes, no skinning.
+        Args:
+          beta: N x 10
+        Updates:
+          self.J_transformed: N x 24 x 3 T-pose joint locations
+        Returns:
+          - Verts: N x 6890 x 3 T-posed shaped mesh
+          - joints: N x 19 or 14 x 3 joint locations on that mesh
+        Results are cached by beta rounded to shape_cache_decimals.
+        """
+        beta = np.round(np.asarray(beta, np.float64), self.shape_cache_decimals)
+        out = [self._shaped_cached(tuple(b.tolist())) for b in beta]
+        verts, J, joints = [np.stack(x) for x in zip(*out)]
+        self.J_transformed = J
+        return verts, joints
+
+    def __call__(self, beta, theta, get_skin=False, shape_only=False):
+        """
+        Obtain SMPL with shape (beta) & pose (theta) inputs.
+        Theta includes the global rotation.
+        Args:
+          beta: N x 10
+          theta: N x 72 (with 3-D axis-angle rep)
+          shape_only: if True, theta is ignored and shaped(beta) is returned
+
+        Updates:
+        self.J_transformed: N x 24 x 3 joint location after shaping
+                 & posing with beta and theta
+        Returns:
+          - joints: N x 19 or 14 x 3 joint locations depending on joint_type
+        If get_skin is True, also returns
+          - Verts: N x 6980 x 3
+        """
+        if shape_only:
+            return self.shaped(beta)
+
+        beta = np.asarray(beta, self.dtype)
+        theta = np.asarray(theta, self.dtype)
+        num_batch = beta.shape[0]
+
+        # 1. Add shape blend shapes
+        # (N x 10) x (10 x 6890*3) = N x 6890 x 3
+        v_shaped = np.reshape(
+            beta.dot(self.shapedirs),
+            [-1, self.size[0], self.size[1]]) + self.v_template
+
+        # 2. Infer shape-dependent joint locations.
+        J = batch_regress(self.J_regressor, v_shaped)
+
+        # 3. Add pose blend shapes
+        # N x 24 x 3 x 3
+        Rs = np.reshape(
+            batch_rodrigues(np.reshape(theta, [-1, 3])), [-1, 24, 3, 3])
+        # Ignore global rotation.
+        pose_feature = np.reshape(Rs[:, 1:, :, :] - np.eye(3, dtype=self.dtype),
+                                  [-1, 207])
+
+        # (N x 207) x (207, 20670) -> N x 6890 x 3
+        v_posed = np.reshape(
+            pose_feature.dot(self.posedirs),
+            [-1, self.size[0], self.size[1]]) + v_shaped
+
+        #4. Get the global joint location
+        self.J_transformed, A = batch_global_rigid_transformation(
+            Rs, J, self.parents, levels=self.levels)
+
+        # 5. Do skinning:
+        if self.skin_topk is None:
+            # (6890 x 24) x (N x 24 x 16) -> N x 6890 x 4 x 4
+            T = np.matmul(self.weights, np.reshape(A, [num_batch, 24, 16]))
+        else:
+            # (N x 6890 x k x 16) weighted by (6890 x k x 1)
+            A_vert = np.reshape(A, [num_batch, 24, 16])[:, self.skin_idx]
+            T = np.sum(A_vert * self.skin_w, axis=2)
+        T = T.reshape([num_batch, -1, 4, 4])
+        verts = np.einsum('nvij,nvj->nvi', T[:, :, :3, :3], v_posed) + T[:, :, :3, 3]
+
+        # Get cocoplus or lsp joints:
+        joints = batch_regress(self.joint_regressor, verts)
+
+        if get_skin:
+            return verts, joints, Rs
+        else:
+            return joints
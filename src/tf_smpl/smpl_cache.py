@@ -0,0 +1,178 @@
+"""
+Flat, memory-mappable copy of the SMPL model pickle.
+
+Unpickling neutral_smpl_with_cocoplus_reg.pkl needs chumpy and gives every
+process its own copy of the arrays. convert_model writes each array as a raw
+.npy file (float32, regressors as CSR components) in a directory next to the
+pickle; load_model maps those files read-only so every worker on a host
+shares the same physical pages, and falls back to the pickle otherwise.
+The directory records the sha1, size and mtime of the pickle it was
+converted from and is ignored once the pickle changes; the pickle is only
+hashed again when its size or mtime differ.
+
+Usage:
+python -m src.tf_smpl.smpl_cache models/neutral_smpl_with_cocoplus_reg.pkl
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import shutil
+import hashlib
+import pickle as pickle
+
+import numpy as np
+import scipy.sparse as sp
+
+DENSE_KEYS = ['v_template', 'shapedirs', 'posedirs', 'weights']
+SPARSE_KEYS = ['J_regressor', 'cocoplus_regressor']
+CSR_PARTS = ['data', 'indices', 'indptr', 'shape']
+KEY_FILE = 'source.key'
+
+
+# There are chumpy variables so convert them to numpy.
+def undo_chumpy(x):
+    return x if isinstance(x, np.ndarray) else x.r
+
+
+def cache_dir(pkl_path):
+    """ Directory holding the flat copy of pkl_path. """
+    return os.path.splitext(pkl_path)[0]
+
+
+def source_key(pkl_path):
+    """ sha1 of the pickle at pkl_path. """
+    with open(pkl_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def source_stat(pkl_path):
+    """ (size, mtime in ns) of the pickle at pkl_path. """
+    st = os.stat(pkl_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def write_key(flat_dir, sha1, stat):
+    """ Records sha1 and (size, mtime) of the source pickle in flat_dir. """
+    key_path = os.path.join(flat_dir, KEY_FILE)
+    tmp_path = '%s.%d.tmp' % (key_path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write('%s %d %d\n' % ((sha1,) + tuple(stat)))
+        os.replace(tmp_path, key_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_key(flat_dir):
+    """
+    (sha1, (size, mtime)) of the pickle flat_dir was converted from, None if
+    unknown.
+    """
+    try:
+        with open(os.path.join(flat_dir, KEY_FILE)) as f:
+            sha1, size, mtime = f.read().split()
+        return sha1, (int(size), int(mtime))
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def is_current(flat_dir, pkl_path):
+    """
+    Whether flat_dir was converted from the pickle at pkl_path. Hashes the
+    pickle only if its size or mtime changed (e.g. it was copied), and then
+    records the new ones when flat_dir is writable.
+    """
+    key = read_key(flat_dir)
+    if key is None:
+        return False
+    sha1, stat = key
+    new_stat = source_stat(pkl_path)
+    if stat == new_stat:
+        return True
+    if sha1 != source_key(pkl_path):
+        return False
+    try:
+        write_key(flat_dir, sha1, new_stat)
+    except (IOError, OSError):
+        pass
+    return True
+
+
+def convert_model(pkl_path, out_dir=None):
+    """
+    Writes the arrays of the SMPL pickle at pkl_path as .npy files in out_dir
+    (cache_dir(pkl_path) by default), replacing a previous conversion.
+    Returns out_dir.
+    """
+    if out_dir is None:
+        out_dir = cache_dir(pkl_path)
+    # Taken first, so that a write during the conversion changes it.
+    stat = source_stat(pkl_path)
+    with open(pkl_path, 'rb') as f:
+        data = f.read()
+    dd = pickle.loads(data, encoding="latin-1")
+
+    tmp_dir = '%s.%d.tmp' % (out_dir, os.getpid())
+    os.makedirs(tmp_dir)
+    try:
+        for key in DENSE_KEYS:
+            np.save(os.path.join(tmp_dir, key + '.npy'),
+                    np.ascontiguousarray(undo_chumpy(dd[key]),
+                                         dtype=np.float32))
+        np.save(os.path.join(tmp_dir, 'kintree_table.npy'),
+                np.asarray(dd['kintree_table'], dtype=np.int64))
+        for key in SPARSE_KEYS:
+            regressor = sp.csr_matrix(dd[key], dtype=np.float32)
+            for part in CSR_PARTS:
+                np.save(os.path.join(tmp_dir, '%s_%s.npy' % (key, part)),
+                        np.asarray(getattr(regressor, part)))
+        write_key(tmp_dir, hashlib.sha1(data).hexdigest(), stat)
+
+        # Workers that mapped the old files keep them until they exit.
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir)
+        os.rename(tmp_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return out_dir
+
+
+def load_model(pkl_path, mmap_mode='r'):
+    """
+    Returns the SMPL model dict of pkl_path: dense arrays are memory-mapped
+    from cache_dir(pkl_path) when convert_model has been run, regressors are
+    scipy sparse matrices. Falls back to unpickling pkl_path when there is
+    no conversion or it was made from another version of the pickle.
+    """
+    flat_dir = cache_dir(pkl_path)
+    if not os.path.isdir(flat_dir):
+        with open(pkl_path, 'rb') as f:
+            return pickle.load(f, encoding="latin-1")
+    if not is_current(flat_dir, pkl_path):
+        print('%s does not match %s, loading the pickle. Run convert_model '
+              'again to update it.' % (flat_dir, pkl_path))
+        with open(pkl_path, 'rb') as f:
+            return pickle.load(f, encoding="latin-1")
+
+    def load(name):
+        return np.load(os.path.join(flat_dir, name + '.npy'),
+                       mmap_mode=mmap_mode)
+
+    dd = dict((key, load(key)) for key in DENSE_KEYS)
+    dd['kintree_table'] = np.asarray(load('kintree_table'))
+    for key in SPARSE_KEYS:
+        data, indices, indptr, shape = [
+            load('%s_%s' % (key, part)) for part in CSR_PARTS]
+        dd[key] = sp.csr_matrix((data, indices, indptr), shape=tuple(shape))
+    return dd
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print('Wrote %s' % convert_model(path))
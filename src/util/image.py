@@ -1,9 +1,14 @@
 """
 Preprocessing stuff.
 """
+from glob import glob
+from os.path import join
+
 import numpy as np
 import cv2
 
+IMAGE_EXTENSIONS = ['*.png', '*.jpg', '*.jpeg']
+
 
 def resize_img(img, scale_factor):
     new_size = (np.floor(np.array(img.shape[0:2]) * scale_factor)).astype(int)
@@ -38,3 +43,31 @@ def scale_and_crop(image, scale, center, img_size):
     }
 
     return crop, proc_param
+
+
+def center_crop(image, img_size=224):
+    """
+    Scales image so that its longer side is img_size, crops img_size x
+    img_size around its center and normalizes it to [-1, 1], like
+    demo.preprocess_image without openpose.
+    """
+    if image.shape[2] == 4:
+        image = image[:, :, :3]
+    scale = float(img_size) / np.max(image.shape[:2])
+    center = np.round(np.array(image.shape[:2]) / 2).astype(int)[::-1]
+    crop, _ = scale_and_crop(image, scale, center, img_size)
+    return 2 * ((crop / 255.) - 0.5)
+
+
+def load_crops(img_dir, img_size=224):
+    """
+    Returns the sorted image paths of img_dir and their center_crop,
+    N x img_size x img_size x 3.
+    """
+    paths = sorted(sum([glob(join(img_dir, ext)) for ext in IMAGE_EXTENSIONS],
+                       []))
+    crops = [
+        center_crop(cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB),
+                    img_size) for path in paths
+    ]
+    return paths, np.stack(crops)
@@ -0,0 +1,93 @@
+"""
+Shared session factory for inference.
+
+With the default ConfigProto every TF session sizes its thread pools to all
+cores of the host, so several worker processes on one host oversubscribe
+them. make_session takes the intra-op / inter-op thread counts and the CPUs
+the process is pinned to from its arguments, or else from the environment:
+
+  HMR_INTRA_OP_THREADS  threads of a single op (matmul, conv), 0 = TF default
+  HMR_INTER_OP_THREADS  ops run in parallel, 0 = TF default
+  HMR_CPU_AFFINITY      CPUs of the process, e.g. "0-3" or "0,2,4-7"
+
+e.g. four workers with four threads each on a 16 core host:
+  HMR_INTRA_OP_THREADS=4 HMR_INTER_OP_THREADS=1 HMR_CPU_AFFINITY=0-3 ...
+  HMR_INTRA_OP_THREADS=4 HMR_INTER_OP_THREADS=1 HMR_CPU_AFFINITY=4-7 ...
+
+src.benchmark.thread_sweep measures the throughput of such layouts.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+INTRA_OP_ENV = 'HMR_INTRA_OP_THREADS'
+INTER_OP_ENV = 'HMR_INTER_OP_THREADS'
+AFFINITY_ENV = 'HMR_CPU_AFFINITY'
+
+
+def parse_cpus(spec):
+    """ Set of CPU ids of a "0-3,8" style list. """
+    cpus = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def env_threads(name):
+    """ Thread count of the environment variable name, None if unset. """
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def pin_cpus(cpus=None):
+    """
+    Pins the process to cpus (a set or a "0-3,8" string, AFFINITY_ENV by
+    default). Does nothing if neither is set or the platform has no
+    sched_setaffinity. Returns the CPUs the process runs on, or None.
+    """
+    if cpus is None:
+        cpus = os.environ.get(AFFINITY_ENV)
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return None
+    if isinstance(cpus, str):
+        cpus = parse_cpus(cpus)
+    os.sched_setaffinity(0, cpus)
+    return os.sched_getaffinity(0)
+
+
+def session_config(intra_op=None, inter_op=None):
+    """
+    ConfigProto with the given thread counts, INTRA_OP_ENV / INTER_OP_ENV
+    by default. Unset counts keep the TF default (0, one per core).
+    """
+    import tensorflow as tf
+
+    if intra_op is None:
+        intra_op = env_threads(INTRA_OP_ENV)
+    if inter_op is None:
+        inter_op = env_threads(INTER_OP_ENV)
+    return tf.ConfigProto(
+        intra_op_parallelism_threads=intra_op or 0,
+        inter_op_parallelism_threads=inter_op or 0)
+
+
+def make_session(graph=None, intra_op=None, inter_op=None, cpus=None):
+    """
+    tf.Session of graph (the default graph if None) using session_config,
+    after pinning the process with pin_cpus. TF sizes its thread pools when
+    the first session of the process is created, so the first call decides.
+    """
+    import tensorflow as tf
+
+    pin_cpus(cpus)
+    return tf.Session(graph=graph, config=session_config(intra_op, inter_op))
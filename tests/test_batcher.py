@@ -0,0 +1,138 @@
+"""
+MicroBatcher against a stub model that records the batches it is given.
+"""
+import threading
+from time import sleep
+from concurrent.futures import CancelledError
+
+import numpy as np
+import pytest
+
+from src.batcher import MicroBatcher
+
+IMG_SIZE = 2
+
+
+class StubModel(object):
+    """ predict_dict returning the first pixel of every crop as 'value'. """
+
+    def __init__(self, error=None, gate=None):
+        self.batches = []
+        self.error = error
+        self.gate = gate
+
+    def predict_dict(self, images):
+        self.batches.append(images[:, 0, 0, 0].tolist())
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return {'value': images[:, 0, 0, 0], 'double': images[:, 0] * 2}
+
+
+def crop(value):
+    return np.full((IMG_SIZE, IMG_SIZE, 3), value, np.float32)
+
+
+def make_batcher(model, **kwargs):
+    return MicroBatcher(model, img_size=IMG_SIZE, **kwargs)
+
+
+def test_flushes_at_max_batch_size():
+    model = StubModel()
+    batcher = make_batcher(model, max_batch_size=4, max_wait=10)
+    futures = [batcher.submit(crop(i)) for i in range(4)]
+    # well before max_wait
+    assert [f.result(timeout=2)['value'] for f in futures] == [0, 1, 2, 3]
+    assert model.batches == [[0, 1, 2, 3]]
+    batcher.close()
+
+
+def test_flushes_at_max_wait():
+    model = StubModel()
+    batcher = make_batcher(model, max_batch_size=32, max_wait=0.05)
+    futures = [batcher.submit(crop(i)) for i in range(3)]
+    assert [f.result(timeout=2)['value'] for f in futures] == [0, 1, 2]
+    assert model.batches == [[0, 1, 2]]
+    batcher.close()
+
+
+def test_every_caller_gets_its_own_rows():
+    model = StubModel()
+    batcher = make_batcher(model, max_batch_size=8, max_wait=0.05)
+    results = {}
+
+    def call(i):
+        images = np.stack([crop(10 * i), crop(10 * i + 1)])
+        results[i] = batcher.predict_dict(images)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    batcher.close()
+
+    for i in range(6):
+        np.testing.assert_array_equal(results[i]['value'], [10 * i, 10 * i + 1])
+        assert results[i]['double'].shape == (2, IMG_SIZE, 3)
+        np.testing.assert_array_equal(results[i]['double'][:, 0, 0],
+                                      [20 * i, 20 * i + 2])
+    assert sum(len(batch) for batch in model.batches) == 12
+    assert max(len(batch) for batch in model.batches) <= 8
+
+
+def test_model_error_reaches_every_future():
+    model = StubModel(error=ValueError('bad batch'))
+    batcher = make_batcher(model, max_batch_size=3, max_wait=10)
+    futures = [batcher.submit(crop(i)) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match='bad batch'):
+            future.result(timeout=2)
+    assert model.batches == [[0, 1, 2]]
+    batcher.close()
+
+
+def test_skips_cancelled_crops():
+    gate = threading.Event()
+    model = StubModel(gate=gate)
+    batcher = make_batcher(model, max_batch_size=1, max_wait=0)
+    first = batcher.submit(crop(1))
+    # the batching thread is now blocked in predict_dict on the first crop
+    while not model.batches:
+        sleep(0.01)
+    cancelled = batcher.submit(crop(2))
+    last = batcher.submit(crop(3))
+    assert cancelled.cancel()
+    gate.set()
+
+    assert first.result(timeout=2)['value'] == 1
+    assert last.result(timeout=2)['value'] == 3
+    with pytest.raises(CancelledError):
+        cancelled.result()
+    assert model.batches == [[1], [3]]
+    batcher.close()
+
+
+def test_close_serves_queued_crops_and_rejects_later_ones():
+    model = StubModel()
+    batcher = make_batcher(model, max_batch_size=32, max_wait=10)
+    futures = [batcher.submit(crop(i)) for i in range(3)]
+    batcher.close()
+    assert [f.result(timeout=0)['value'] for f in futures] == [0, 1, 2]
+    assert not batcher.thread.is_alive()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit(crop(4))
+    with pytest.raises(RuntimeError):
+        batcher.predict_dict(np.stack([crop(5)]))
+    batcher.close()
+
+
+def test_rejects_bad_crops():
+    batcher = make_batcher(StubModel())
+    with pytest.raises(ValueError):
+        batcher.submit(np.zeros((IMG_SIZE, IMG_SIZE + 1, 3)))
+    with pytest.raises(ValueError):
+        batcher.predict_dict(np.zeros((0, IMG_SIZE, IMG_SIZE, 3)))
+    batcher.close()
@@ -0,0 +1,42 @@
+"""
+ONNX Runtime backend against the TF RunModel on the sample images, the
+pytest version of src.benchmark.onnx_parity. Skipped unless TensorFlow,
+onnxruntime, cv2 and the exported model are available.
+"""
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMG_DIR = os.path.join(ROOT, 'sample_data', 'input')
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('cv2')
+
+from src.RunModel import make_model
+from src.onnx_backend import ONNX_PATH
+from src.util.image import load_crops
+from src.benchmark.onnx_parity import OUTPUTS, PARITY_TOL, max_diffs
+
+
+@pytest.fixture
+def images(monkeypatch):
+    # the models are found relative to the repository root
+    monkeypatch.chdir(ROOT)
+    if not os.path.exists(ONNX_PATH):
+        pytest.skip('%s not exported, run python -m src.onnx_backend'
+                    % ONNX_PATH)
+    _, images = load_crops(IMG_DIR)
+    return images
+
+
+def test_onnx_matches_tf(images):
+    tf_res = make_model('tf').predict_dict(images)
+    onnx_res = make_model('onnx').predict_dict(images)
+    for key in OUTPUTS:
+        assert onnx_res[key].shape == tf_res[key].shape, key
+
+    diffs = max_diffs(tf_res, onnx_res)
+    assert diffs['theta'] <= PARITY_TOL, diffs
+    assert diffs['cams'] <= PARITY_TOL, diffs
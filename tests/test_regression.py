@@ -0,0 +1,166 @@
+"""
+Pins the vectorized measurement and SMPL code against the per-point and
+per-joint loops they replaced.
+"""
+import os
+import pickle
+
+import numpy as np
+import scipy.sparse as sp
+import pytest
+
+import utils
+import extract_measurements as em
+import mesh_io
+from src.tf_smpl.np_smpl import SMPL
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_test_obj():
+    with open(os.path.join(ROOT, 'test.obj')) as f:
+        return np.array([list(map(float, line.split()[1:]))
+                         for line in f if line.startswith('v ')])
+
+
+def legacy_calc_measure(cp, vertex, height):
+    """ calc_measure before compile_cp, one control point at a time. """
+    measure_list = []
+    for measure in cp:
+        length = 0.0
+        p2 = vertex[int(measure[0][1]), :]
+        for i in range(0, len(measure)):
+            p1 = p2
+            if measure[i][0] == 1:
+                p2 = vertex[int(measure[i][1]), :]
+            elif measure[i][0] == 2:
+                p2 = vertex[int(measure[i][1]), :] * measure[i][3] + \
+                    vertex[int(measure[i][2]), :] * measure[i][4]
+            else:
+                p2 = vertex[int(measure[i][1]), :] * measure[i][4] + \
+                    vertex[int(measure[i][2]), :] * measure[i][5] + \
+                    vertex[int(measure[i][3]), :] * measure[i][6]
+            length += np.sqrt(np.sum((p1 - p2)**2.0))
+        measure_list.append(length * 100)
+    measure_list = float(height) * (measure_list / measure_list[0])
+    measure_list[8] = measure_list[8] * 0.36
+    measure_list[3] = measure_list[3] * 0.6927
+    return np.array(measure_list).reshape(utils.M_NUM, 1)
+
+
+def legacy_get_deform(vertex, facet, d_inv_mean):
+    """ get_deform before assemble_faces, one face at a time. """
+    deform = np.zeros((len(facet), 9))
+    for i in range(len(facet)):
+        v = [k - 1 for k in facet[i, :]]
+        Q = utils.assemble_face(vertex[v[0], :], vertex[v[1], :],
+                                vertex[v[2], :]).dot(d_inv_mean[i])
+        deform[i, :] = Q.flat
+    return deform
+
+
+@pytest.mark.parametrize('height', [150, 170, 195.5])
+def test_sparse_plan_matches_legacy_loop(height):
+    vertex = load_test_obj()
+    cp = em.convert_cp(os.path.join(ROOT, em.CP_PATH))
+    expected = legacy_calc_measure(cp, vertex, height)
+    measure = em.calc_measure(em.compile_cp(cp), vertex, height)
+    assert measure.shape == (utils.M_NUM, 1)
+    np.testing.assert_allclose(measure, expected, rtol=1e-12)
+
+
+def test_get_deform_matches_legacy_loop():
+    rng = np.random.RandomState(0)
+    vertex = load_test_obj()
+    facet = np.load(os.path.join(ROOT, 'src', 'tf_smpl', 'smpl_faces.npy'))
+    facet = facet[:500].astype(np.int64) + 1
+    d_inv_mean = rng.randn(len(facet), 3, 3)
+    np.testing.assert_allclose(utils.get_deform(vertex, facet, d_inv_mean),
+                               legacy_get_deform(vertex, facet, d_inv_mean),
+                               rtol=1e-10, atol=1e-12)
+
+
+def test_weight_matches_legacy_loop():
+    vertex = load_test_obj()
+    faces = mesh_io.get_faces()
+    volume = sum(np.cross(vertex[f[0]], vertex[f[1]]).dot(vertex[f[2]])
+                 for f in faces) / 6.0
+    assert abs(utils.calc_volume(vertex, faces) - volume) < 1e-12
+
+    # a batch split over several path and weight chunks
+    vertices = vertex + np.random.RandomState(0).randn(5, 1, 3) * 0.01
+    heights = np.array([150., 160., 170., 180., 190.])
+    _, weight = em.extract_measurements_batch(heights, vertices, chunk_size=2,
+                                              return_weight=True)
+    plan = em.get_plan()
+    expected = [em.calc_weight(plan, v, h) for v, h in zip(vertices, heights)]
+    np.testing.assert_allclose(weight, expected, rtol=1e-6)
+
+
+def make_smpl_pickle(path, num_verts=300, seed=0):
+    """ Random SMPL model of the real layout, 24 joints and 19 cocoplus. """
+    rng = np.random.RandomState(seed)
+    parents = [2**32 - 1, 0, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 9, 9, 12, 13, 14,
+               16, 17, 18, 19, 20, 21]
+
+    def regressor(k):
+        m = sp.random(k, num_verts, density=0.05, random_state=rng).tocsr()
+        return sp.csc_matrix(sp.diags(1. / (m.sum(1).A1 + 1e-9)).dot(m))
+
+    weights = rng.rand(num_verts, 24)**8
+    dd = {
+        'v_template': rng.rand(num_verts, 3),
+        'shapedirs': rng.randn(num_verts, 3, 10) * 0.01,
+        'posedirs': rng.randn(num_verts, 3, 207) * 0.001,
+        'J_regressor': regressor(24),
+        'cocoplus_regressor': regressor(19),
+        'kintree_table': np.stack([np.array(parents, np.int64),
+                                   np.arange(24)]),
+        'weights': weights / weights.sum(1, keepdims=True),
+    }
+    with open(path, 'wb') as f:
+        pickle.dump(dd, f)
+    return dd
+
+
+def rodrigues(rotvec):
+    """ Rotation matrix of one axis-angle, with the 1e-8 of batch_rodrigues. """
+    angle = np.linalg.norm(rotvec + 1e-8)
+    r = rotvec / angle
+    skew = np.array([[0, -r[2], r[1]], [r[2], 0, -r[0]], [-r[1], r[0], 0]])
+    return (np.cos(angle) * np.eye(3) + (1 - np.cos(angle)) * np.outer(r, r) +
+            np.sin(angle) * skew)
+
+
+def reference_smpl(dd, beta, theta):
+    """ SMPL of one beta / theta, composing the joint transforms one by one. """
+    parents = dd['kintree_table'][0]
+    v_shaped = dd['v_template'] + dd['shapedirs'].dot(beta)
+    J = dd['J_regressor'].dot(v_shaped)
+    R = np.array([rodrigues(r) for r in theta.reshape(24, 3)])
+    v_posed = v_shaped + dd['posedirs'].dot((R[1:] - np.eye(3)).ravel())
+    G = np.zeros((24, 4, 4))
+    for i in range(24):
+        A = np.eye(4)
+        A[:3, :3] = R[i]
+        A[:3, 3] = J[i] - J[parents[i]] if i else J[i]
+        G[i] = G[parents[i]].dot(A) if i else A
+    G[:, :3, 3] -= np.einsum('jab,jb->ja', G[:, :3, :3], J)
+    T = np.einsum('vj,jab->vab', dd['weights'], G)
+    verts = np.einsum('vab,vb->va', T[:, :3, :3], v_posed) + T[:, :3, 3]
+    return verts, dd['cocoplus_regressor'].dot(verts)
+
+
+def test_np_smpl_matches_per_joint_reference(tmp_path):
+    pkl_path = str(tmp_path / 'smpl.pkl')
+    dd = make_smpl_pickle(pkl_path)
+    rng = np.random.RandomState(1)
+    beta = rng.randn(3, 10)
+    theta = rng.randn(3, 72) * 0.5
+
+    verts, joints, _ = SMPL(pkl_path, dtype=np.float64)(beta, theta,
+                                                         get_skin=True)
+    for n in range(len(beta)):
+        ref_verts, ref_joints = reference_smpl(dd, beta[n], theta[n])
+        np.testing.assert_allclose(verts[n], ref_verts, atol=1e-10)
+        np.testing.assert_allclose(joints[n], ref_joints, atol=1e-10)
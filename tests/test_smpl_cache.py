@@ -0,0 +1,53 @@
+"""
+Validation of the flat SMPL cache against its source pickle.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from src.tf_smpl import smpl_cache
+from test_regression import make_smpl_pickle
+
+
+@pytest.fixture
+def converted(tmp_path):
+    pkl_path = str(tmp_path / 'smpl.pkl')
+    make_smpl_pickle(pkl_path)
+    smpl_cache.convert_model(pkl_path)
+    return pkl_path
+
+
+def no_hashing(pkl_path):
+    raise AssertionError('hashed %s' % pkl_path)
+
+
+def test_unchanged_pickle_is_not_hashed(converted, monkeypatch):
+    monkeypatch.setattr(smpl_cache, 'source_key', no_hashing)
+    dd = smpl_cache.load_model(converted)
+    assert isinstance(dd['v_template'], np.memmap)
+
+
+def test_touched_pickle_is_hashed_once(converted, monkeypatch):
+    st = os.stat(converted)
+    os.utime(converted, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert isinstance(smpl_cache.load_model(converted)['v_template'],
+                      np.memmap)
+
+    # the new mtime was recorded
+    monkeypatch.setattr(smpl_cache, 'source_key', no_hashing)
+    assert isinstance(smpl_cache.load_model(converted)['v_template'],
+                      np.memmap)
+
+
+def test_changed_pickle_is_loaded(converted):
+    dd = make_smpl_pickle(converted, seed=1)
+    loaded = smpl_cache.load_model(converted)
+    assert not isinstance(loaded['v_template'], np.memmap)
+    np.testing.assert_array_equal(loaded['v_template'], dd['v_template'])
+
+    smpl_cache.convert_model(converted)
+    loaded = smpl_cache.load_model(converted)
+    assert isinstance(loaded['v_template'], np.memmap)
+    np.testing.assert_allclose(loaded['v_template'], dd['v_template'],
+                               rtol=1e-6)
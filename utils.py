@@ -1,4 +1,5 @@
 import numpy as np
+import mesh_io
 
 
 MODEL_DIR = "../release_model"
@@ -7,6 +8,8 @@ F_NUM = 13776#25000
 M_NUM = 11#19
 D_BASIS_NUM = 10
 V_BASIS_NUM = 10
+# kg / m^3, used to turn mesh volume into body weight
+BODY_DENSITY = 1026.0
 
 #M_STR = ["weight", "height", "neck", "chest",
 #  "belly button waist", "gluteal hip",
@@ -42,29 +45,29 @@ PART = [(0.0, np.float64(0.66666700000000001), 1.0),
   (np.float64(0.66666700000000001), 0.0, 1.0),
   (0.0, np.float64(0.32941199999999998), 0.0)]
 
-# save obj file
+# save obj file, f is 1-based
 def save_obj(filename, v, f):
-  file = open(filename, 'w')
-  for i in range(0, v.shape[0]):
-    file.write('v %f %f %f\n'%(v[i][0], v[i][1], v[i][2]))
-  for i in range(0, f.shape[0]):
-    file.write('f %d %d %d\n'%(f[i][0], f[i][1], f[i][2]))
-  file.close()
+  mesh_io.save_obj(filename, v, np.asarray(f) - 1)
   tmp = v[:, 2]
   print('[**] save obj file in {}, height: {}'.format(filename, tmp.max() - tmp.min()))
 
 
-# calculate the corresponding deformation from the input vertex
+# calculate the corresponding deformation from the input vertex, vertex is
+# (V, 3) or (..., V, 3) and the result is (F_NUM, 9) or (..., F_NUM, 9)
 def get_deform(vertex, facet, d_inv_mean):
-  deform = np.zeros((F_NUM, 9))
-  for i in range(0, F_NUM):
-    v = [k - 1 for k in facet[i, :]]
-    v1 = vertex[v[0], :]
-    v2 = vertex[v[1], :]
-    v3 = vertex[v[2], :]
-    Q =  assemble_face(v1, v2, v3).dot(d_inv_mean[i])
-    deform[i, :] = Q.flat
-  return deform
+  deform = np.einsum('...fij,fjk->...fik', assemble_faces(vertex, facet), d_inv_mean)
+  return deform.reshape(deform.shape[:-2] + (9,))
+
+# frames [v21, v31, v41] of every face of one or many meshes, facet is 1-based
+def assemble_faces(vertex, facet):
+  vertex = np.asarray(vertex, dtype=np.float64)
+  f = np.asarray(facet) - 1
+  v1 = vertex[..., f[:, 0], :]
+  v21 = vertex[..., f[:, 1], :] - v1
+  v31 = vertex[..., f[:, 2], :] - v1
+  v41 = np.cross(v21, v31)
+  v41 /= np.sqrt(np.linalg.norm(v41, axis=-1, keepdims=True))
+  return np.stack((v21, v31, v41), axis=-1)
 
 # import the 4th point of the triangle, and calculate the deformation
 def assemble_face(v1, v2, v3):
@@ -74,21 +77,41 @@ def assemble_face(v1, v2, v3):
   v41 /= np.sqrt(np.linalg.norm(v41))
   return np.column_stack((v21, np.column_stack((v31, v41))))
 
+# signed volume of one (V, 3) or many (..., V, 3) meshes, facet is (F, 3) and
+# 0-based. The triple products v0 . (v1 x v2) are summed one coordinate of v0
+# at a time, so only (..., F) float64 gathers are built, never (..., F, 3) ones.
+def calc_volume(vertex, facet):
+  vertex = np.asarray(vertex)
+  f0, f1, f2 = np.asarray(facet).T
+  x, y, z = vertex[..., 0], vertex[..., 1], vertex[..., 2]
+  volume = 0.0
+  for a, b, c in ((x, y, z), (y, z, x), (z, x, y)):
+    b1 = b[..., f1].astype(np.float64)
+    c1 = c[..., f1].astype(np.float64)
+    cross = b1 * c[..., f2] - c1 * b[..., f2]
+    volume = volume + np.einsum('...f,...f->...', a[..., f0].astype(np.float64), cross)
+  return volume / 6.0
+
+# signed volume and surface area of one (V, 3) or many (..., V, 3) meshes,
+# facet is (F, 3) and 0-based
+def calc_volume_area(vertex, facet):
+  vertex = np.asarray(vertex, dtype=np.float64)
+  facet = np.asarray(facet)
+  volume = calc_volume(vertex, facet)
+  v0 = vertex[..., facet[:, 0], :]
+  v1 = vertex[..., facet[:, 1], :]
+  v2 = vertex[..., facet[:, 2], :]
+  area = np.sqrt(np.sum(np.cross(v1 - v0, v2 - v0)**2.0, axis=-1)).sum(axis=-1) / 2.0
+  return volume, area
+
+
 # calculate measure data from given vertex by control points
 def calc_measure(cp, vertex, facet):
   print("Calculating")
   measure_list = []
   # clac weight
-  vol = 0.0
-  kHumanbodyIntensity = 1026.0
-  for i in range(0, F_NUM):
-    f = [c - 1 for c in facet[i, :]]
-    v0 = vertex[f[0], :]
-    v1 = vertex[f[1], :]
-    v2 = vertex[f[2], :]
-    vol += np.cross(v0, v1).dot(v2)
-  vol = abs(vol) / 6.0
-  weight = kHumanbodyIntensity * vol
+  vol, _ = calc_volume_area(vertex, np.asarray(facet) - 1)
+  weight = BODY_DENSITY * abs(vol)
   # weight = weight**(1.0 / 3.0) * 1000
   measure_list.append(weight)
   # calc other measures